@@ -0,0 +1,182 @@
+# end-to-end crawler throughput against benchmarks/mock_server.py, no network access needed
+# usage: python -m benchmarks.bench_crawler [--mode both] [--day-pages 40] [--cycles 5] [--latency 0.02] [--json out.json]
+import argparse
+import io
+import json
+import os
+import resource
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from networks.config import apply_config
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def start_mock_server(args):
+    port = free_port()
+    cmd = [sys.executable, '-m', 'benchmarks.mock_server', '--port', str(port),
+           '--latency', str(args.latency), '--error-rate', str(args.error_rate), '--delete-rate', str(args.delete_rate),
+           '--hole-interval', str(86400 / (args.day_pages * 25)), '--reply-period', str(args.reply_period),
+           '--text-len', str(args.text_len), '--comment-len', str(args.comment_len)]
+    proc = subprocess.Popen(cmd, cwd=os.path.join(os.path.dirname(__file__), '..'), stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(url + '/_stats', timeout=1)
+            return proc, url
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("mock server did not start")
+
+def server_stats(url):
+    with urllib.request.urlopen(url + '/_stats', timeout=5) as resp:
+        return json.load(resp)
+
+def configure(mode, url, data_dir, args):
+    apply_config({
+        'User': {'uid': '0', 'password': 'mock'},
+        'Mode': {'mode': mode},
+        'Defaults': {'page_interval': '0', 'remove_exisited': 'True', 'comments': 'True', 'base_url': url,
+                     'data_dir': data_dir, 'workers': str(args.workers), 'rate_limit': '0', 'hole_history': 'True',
+                     'retry_backoff': '0.2'},
+        'Day': {'num_days': '1', 'prefetch_pages': str(args.prefetch), 'day_workers': str(args.day_workers)},
+        'Monitor': {'get_interval': '0', 'search_pages': str(args.search_pages), 'morning_sleep': 'False',
+                    'max_hole_actions': '5', 'min_poll_interval': '1', 'max_poll_interval': '30',
+                    'request_budget': str(args.request_budget), 'monitor_key_words': 'False',
+                    'monitor_live_key_words': 'True', 'show_hot': 'True', 'show_hot_num': '5', 'show_hot_time': '21'},
+        'Key_Words': {'key_words': '[李白]', 'server_key': ''},
+        'Live_Key_Words': {'live_key_words': '[期末]', 'negative_live_key_words': '[考试]'},
+        'Notify': {'url': url + '/notify.send', 'window': '1', 'min_gap': '0'},
+    })
+
+def make_crawler(mode, url, data_dir, args):
+    from networks.loop import Crawler
+    configure(mode, url, data_dir, args)
+    crawler = Crawler()
+    stdin, sys.stdin = sys.stdin, io.StringIO("000000\n") # answer the SMS code prompt
+    try:
+        crawler.login()
+    finally:
+        sys.stdin = stdin
+    return crawler
+
+def db_rows(crawler):
+    crawler.writer.flush()
+    with sqlite3.connect(crawler.db.database_name) as conn:
+        return sum(conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in ('holes', 'comments'))
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def diff(after, before, key):
+    return after.get(key, 0) - before.get(key, 0)
+
+def bench_day(url, data_dir, args):
+    crawler = make_crawler('day', url, data_dir, args)
+    before = server_stats(url)
+    start = time.perf_counter()
+    crawler.craw_treehole()
+    elapsed = time.perf_counter() - start
+    after = server_stats(url)
+    rows = db_rows(crawler)
+    crawler.close()
+    return {
+        'seconds': elapsed,
+        'pages_per_sec': diff(after, before, '/api/pku_hole') / elapsed,
+        'comments_per_sec': diff(after, before, 'comments') / elapsed,
+        'db_rows_per_sec': rows / elapsed,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+def bench_monitor(url, data_dir, args):
+    crawler = make_crawler('monitor', url, data_dir, args)
+    before = server_stats(url)
+    rows_before = db_rows(crawler)
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(args.cycles):
+        cycle_start = time.perf_counter()
+        crawler.monitor_cycle()
+        latencies.append(time.perf_counter() - cycle_start)
+        time.sleep(args.cycle_gap)
+    elapsed = time.perf_counter() - start - args.cycle_gap * args.cycles
+    after = server_stats(url)
+    rows = db_rows(crawler) - rows_before
+    tracked = len(crawler.tracker)
+    crawler.close()
+    # warm restart from the checkpoint written by close()
+    restart_start = time.perf_counter()
+    crawler = make_crawler('monitor', url, data_dir, args)
+    restart = time.perf_counter() - restart_start
+    restored = len(crawler.tracker)
+    crawler.close()
+    return {
+        'cycles': args.cycles,
+        'cycle_latency_min': min(latencies),
+        'cycle_latency_median': statistics.median(latencies),
+        'cycle_latency_max': max(latencies),
+        'pages_per_sec': diff(after, before, '/api/pku_hole') / elapsed,
+        'comments_per_sec': diff(after, before, 'comments') / elapsed,
+        'db_rows_per_sec': rows / elapsed,
+        'tracked_holes': tracked,
+        'restart_seconds': restart,
+        'restored_holes': restored,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Crawler throughput against the mock TreeHole server")
+    parser.add_argument('--mode', choices=('day', 'monitor', 'both'), default='both')
+    parser.add_argument('--day-pages', type=int, default=40, help="pages the mock server spreads one day over")
+    parser.add_argument('--search-pages', type=int, default=4)
+    parser.add_argument('--cycles', type=int, default=5)
+    parser.add_argument('--cycle-gap', type=float, default=1.0, help="seconds between monitor cycles")
+    parser.add_argument('--request-budget', type=int, default=0, help="monitor requests per minute, 0 for unlimited")
+    parser.add_argument('--reply-period', type=float, default=5.0)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--prefetch', type=int, default=4, help="day mode pages requested ahead")
+    parser.add_argument('--day-workers', type=int, default=1, help="day mode worker processes")
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--delete-rate', type=float, default=0.0)
+    parser.add_argument('--text-len', type=int, default=80)
+    parser.add_argument('--comment-len', type=int, default=30)
+    parser.add_argument('--json', help="write the results to this file")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    proc, url = start_mock_server(args)
+    results = {'args': vars(args)}
+    try:
+        with tempfile.TemporaryDirectory() as data_dir:
+            if args.mode in ('day', 'both'):
+                results['day'] = bench_day(url, data_dir, args)
+            if args.mode in ('monitor', 'both'):
+                results['monitor'] = bench_monitor(url, data_dir, args)
+    finally:
+        proc.terminate()
+        proc.wait()
+    from networks.metrics import metrics
+    results['metrics'] = metrics.to_json() # per stage breakdown of the whole run
+    print("====================================")
+    for mode in ('day', 'monitor'):
+        for key, value in results.get(mode, {}).items():
+            print(f"{mode:8s} {key:22s} {value:.3f}" if isinstance(value, float) else f"{mode:8s} {key:22s} {value}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return results
+
+if __name__ == '__main__':
+    main()
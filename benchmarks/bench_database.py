@@ -0,0 +1,68 @@
+# rows/sec of SQLDatabase writes, legacy per-row path vs batched upsert
+# usage: python -m benchmarks.bench_database [num_rows]
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from networks.database import SQLDatabase
+
+def make_holes_df(num_rows, offset=0):
+    pids = range(offset, offset+num_rows)
+    df = pd.DataFrame({
+        'pid': list(pids),
+        'text': [f"树洞测试文本{pid}" * 4 for pid in pids],
+        'type': 'text',
+        'time': '2024-01-01 12:00:00',
+        'reply': [pid % 50 for pid in pids],
+        'likenum': [pid % 7 for pid in pids],
+        'last_retrive': '2024-01-01 12:01:00',
+    })
+    return df.set_index('pid')
+
+def legacy_update_holes_data(database_name, data):
+    # the pre-batching implementation: new connection, SELECT then UPDATE/INSERT per row
+    with sqlite3.connect(database_name) as conn:
+        c = conn.cursor()
+        for index, row in data.iterrows():
+            c.execute("SELECT * FROM holes WHERE pid=?", (index,))
+            if c.fetchone():
+                c.execute("UPDATE holes SET text=?, type=?, time=?, reply=?, likenum=?, last_retrive=? WHERE pid=?",
+                          (row['text'], row['type'], str(row['time']), row['reply'], row['likenum'], row['last_retrive'], index))
+            else:
+                c.execute("INSERT INTO holes (pid, text, type, time, reply, likenum, last_retrive) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                          (index, row['text'], row['type'], str(row['time']), row['reply'], row['likenum'], row['last_retrive']))
+        conn.commit()
+
+def legacy_database(database_name):
+    # the baseline's holes table in a file of its own, default rollback journal
+    with sqlite3.connect(database_name) as conn:
+        conn.execute('''CREATE TABLE holes (pid INTEGER PRIMARY KEY, text TEXT, type TEXT, time TEXT, reply INTEGER,
+                        likenum INTEGER, last_retrive TEXT)''')
+    return database_name
+
+def run(num_rows=20000, batch=100):
+    frames = [make_holes_df(batch, offset) for offset in range(0, num_rows, batch)]
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = legacy_database(os.path.join(tmp, "legacy.db"))
+        db = SQLDatabase(os.path.join(tmp, "bench.db"))
+        db.create_holes_table()
+        results = {}
+        for name, write in (('legacy', lambda df: legacy_update_holes_data(legacy, df)),
+                            ('batched', db.update_holes_data)):
+            start = time.perf_counter()
+            for _ in range(2): # insert pass then update pass, like a monitor cycle
+                for df in frames:
+                    write(df)
+            elapsed = time.perf_counter() - start
+            results[name] = 2 * num_rows / elapsed
+            print(f"{name:8s} {2*num_rows} rows in {elapsed:.2f}s: {results[name]:.0f} rows/sec")
+        db.close()
+    print(f"speedup: {results['batched']/results['legacy']:.1f}x")
+    return results
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
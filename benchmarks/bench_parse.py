@@ -0,0 +1,50 @@
+# parsing CPU per request, pd.json_normalize path vs networks/parse.py
+# usage: python -m benchmarks.bench_parse [comments_per_thread]
+import json
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from benchmarks.mock_server import TreeHoleWorld
+from networks.parse import loads, parse_comments, parse_holes
+
+def legacy_comments(body):
+    # the pre-records implementation of TreeHoleClient.get_comments_data
+    comments_df = pd.json_normalize(json.loads(body)['data']['data'])
+    comments_df = comments_df.set_index('cid')
+    comments_df['last_retrive'] = str(datetime.now()).split('.')[0]
+    comments_df.text = comments_df.text.astype(str)
+    comments_df.comment_id = comments_df.comment_id.astype(str)
+    comments_df['time'] = comments_df.timestamp.apply(datetime.fromtimestamp).astype(str)
+    return comments_df
+
+def legacy_page(body):
+    page_df = pd.json_normalize(json.loads(body)['data']['data'])
+    page_df = page_df.set_index('pid')
+    page_df['last_retrive'] = str(datetime.now()).split('.')[0]
+    page_df.loc[:, 'text'] = page_df.text.astype(str)
+    page_df['time'] = page_df.timestamp.apply(datetime.fromtimestamp).astype(str)
+    return page_df
+
+def timeit(func, body, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(body)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+def run(comments_per_thread=30, repeat=300):
+    world = TreeHoleWorld(reply_period=1.0, max_reply=comments_per_thread)
+    now = time.time() + comments_per_thread * 10
+    pid = next(p for p in range(world.base_pid - 1000, world.base_pid)
+               if world.reply(p, now) == comments_per_thread)
+    comments = json.dumps({'data': {'data': world.comments(pid, now)}}, ensure_ascii=False).encode()
+    page = json.dumps({'data': {'data': world.page(1, 25, now)}}, ensure_ascii=False).encode()
+    for name, body, legacy, fast in (('comments', comments, legacy_comments, lambda b: parse_comments(loads(b)['data']['data'])),
+                                     ('page', page, legacy_page, lambda b: parse_holes(loads(b)['data']['data']))):
+        old_us, new_us = timeit(legacy, body, repeat), timeit(fast, body, repeat)
+        print(f"{name:8s} pandas {old_us:8.1f} us/request  records {new_us:8.1f} us/request  {old_us/new_us:5.1f}x")
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 30)
@@ -0,0 +1,61 @@
+# SQLDatabase.search latency over a generated holes table, FTS index vs LIKE scan
+# usage: python -m benchmarks.bench_search [--holes 1000000] [--repeat 5] [--json out.json]
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.mock_server import TreeHoleWorld
+from networks.database import SQLDatabase
+
+QUERIES = (['学生'], ['时间'], ['学生', '时间'], ['大学生'], ['国', '学生'], ['学生会主席'])
+
+def build(db, holes, chunk_rows=10000):
+    world = TreeHoleWorld()
+    db.create_holes_table()
+    for start in range(0, holes, chunk_rows):
+        db.upsert_holes((pid, world.text(pid, 80), 'text', '2024-01-01 12:00:00', pid % 50, pid % 7,
+                         '2024-01-01 12:01:00') for pid in range(start, min(holes, start + chunk_rows)))
+
+def timed(db, key_words, repeat):
+    times = []
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        rows = db.search(key_words, limit=50)
+        times.append((time.perf_counter() - begin) * 1000)
+    return statistics.median(times), len(rows)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search latency, FTS index vs LIKE scan")
+    parser.add_argument('--holes', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', help="write the results to this file")
+    args = parser.parse_args(argv)
+    results = {'args': vars(args), 'queries': {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        db = SQLDatabase(os.path.join(tmp, "bench.db"), remove_exisited=False)
+        begin = time.perf_counter()
+        build(db, args.holes)
+        results['build_seconds'] = time.perf_counter() - begin
+        db.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        results['db_mb'] = os.path.getsize(db.database_name) / 2**20
+        print(f"{args.holes} holes in {results['build_seconds']:.1f}s, {results['db_mb']:.0f} MB")
+        print(f"{'key words':16s} {'rows':>5s} {'fts ms':>9s} {'like ms':>9s}")
+        for key_words in QUERIES:
+            db.fts = True
+            fts_ms, rows = timed(db, key_words, args.repeat)
+            db.fts = False
+            like_ms, like_rows = timed(db, key_words, args.repeat)
+            assert rows == like_rows
+            results['queries'][' '.join(key_words)] = {'rows': rows, 'fts_ms': fts_ms, 'like_ms': like_ms}
+            print(f"{' '.join(key_words):16s} {rows:5d} {fts_ms:9.1f} {like_ms:9.1f}")
+        db.close()
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    return results
+
+if __name__ == '__main__':
+    main()
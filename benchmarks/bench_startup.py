@@ -0,0 +1,122 @@
+# cold start time and peak RSS of every main.py command, each run in a fresh interpreter
+# monitor/day stop after the crawler is constructed (no login), the others run against a generated database
+# usage: python -m benchmarks.bench_startup [--holes 2000] [--repeat 5] [--json out.json]
+import argparse
+import configparser
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+PROBE = r'''
+import json, resource, sys
+sys.path.insert(0, {root!r})
+import main
+argv = sys.argv[1:]
+args = main.build_parser().parse_args(argv)
+if args.command in ('monitor', 'day'):
+    from networks.config import load_config
+    load_config(args.config, main.overrides(args))
+    from networks.loop import Crawler
+    Crawler().close()
+else:
+    main.main(argv)
+print(json.dumps({{'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  'pandas': 'pandas' in sys.modules, 'numpy': 'numpy' in sys.modules}}))
+'''
+
+COMMANDS = {
+    'monitor': ['monitor'],
+    'day': ['day'],
+    'search': ['search', '期末', '考试'],
+    'export': ['export'],
+    'stats': ['stats', '--table', 'holes'],
+}
+
+def write_config(data_dir):
+    parser = configparser.ConfigParser()
+    parser.read(os.path.join(ROOT, 'config_sample.ini'), encoding='UTF-8')
+    parser.read_dict({
+        'Defaults': {'data_dir': data_dir, 'base_url': 'http://127.0.0.1:9', 'checkpoint': 'False'},
+        'Monitor': {'monitor_key_words': 'False'},
+        'Notify': {'enabled': 'False'},
+        'Metrics': {'enabled': 'False'},
+        'Stats': {'processes': '1'},
+    })
+    path = os.path.join(data_dir, 'config.ini')
+    with open(path, 'w', encoding='UTF-8') as f:
+        parser.write(f)
+    return path
+
+def make_database(data_dir, holes):
+    # one day database of synthetic holes with a few comments each
+    sys.path.insert(0, ROOT)
+    from benchmarks.mock_server import TreeHoleWorld
+    from networks.parse import parse_comments, parse_holes, hole_rows
+    world = TreeHoleWorld(hole_interval=86400 / holes)
+    now = time.time()
+    records = parse_holes(world.page(1, holes, now))
+    comments = [row for r in records[:holes // 4] for row in parse_comments(world.comments(r['pid'], now)[:5])]
+    path = os.path.join(data_dir, time.strftime('%Y-%m-%d') + '_holes_day.db')
+    conn = sqlite3.connect(path)
+    conn.execute('''CREATE TABLE holes (pid INTEGER PRIMARY KEY, text TEXT, type TEXT, time TEXT, reply INTEGER,
+                    likenum INTEGER, last_retrive TEXT)''')
+    conn.execute('''CREATE TABLE comments (cid INTEGER PRIMARY KEY, pid INTEGER, text TEXT, name TEXT, time TEXT,
+                    comment_id TEXT, last_retrive TEXT)''')
+    last_retrive = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now - 3600))
+    conn.executemany("INSERT INTO holes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     [row._replace(last_retrive=last_retrive) for row in hole_rows(records)])
+    conn.executemany("INSERT INTO comments VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     [row._replace(last_retrive=last_retrive) for row in comments])
+    conn.commit()
+    conn.close()
+
+def run(command, config_path):
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-c', PROBE.format(root=ROOT), '-c', config_path] + command,
+                          cwd=ROOT, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"{command} failed:\n{proc.stdout}\n{proc.stderr}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result['seconds'] = elapsed
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cold start and peak RSS of the main.py commands")
+    parser.add_argument('--holes', type=int, default=2000, help="holes in the generated database")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', help="write the results to this file")
+    args = parser.parse_args(argv)
+    results = {'args': vars(args)}
+    with tempfile.TemporaryDirectory() as data_dir:
+        config_path = write_config(data_dir)
+        make_database(data_dir, args.holes)
+        for name, command in COMMANDS.items():
+            runs = [run(command, config_path) for _ in range(args.repeat)]
+            results[name] = {
+                'first_seconds': runs[0]['seconds'],
+                'median_seconds': statistics.median(r['seconds'] for r in runs),
+                'peak_rss_mb': max(r['rss_mb'] for r in runs),
+                'pandas': runs[0]['pandas'],
+                'numpy': runs[0]['numpy'],
+            }
+    print("====================================")
+    print(f"{'command':10s} {'first s':>8s} {'median s':>9s} {'rss MB':>7s}  pandas numpy")
+    for name in COMMANDS:
+        r = results[name]
+        print(f"{name:10s} {r['first_seconds']:8.3f} {r['median_seconds']:9.3f} {r['peak_rss_mb']:7.1f}  "
+              f"{str(r['pandas']):6s} {r['numpy']}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return results
+
+if __name__ == '__main__':
+    main()
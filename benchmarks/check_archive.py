@@ -0,0 +1,71 @@
+# incremental copies of networks/archive.py: rows committed after the watermark moved past them are still archived,
+# unchanged sources copy nothing
+# usage: python -m benchmarks.check_archive
+import os
+import tempfile
+
+from networks.archive import Archive
+from networks.database import SQLDatabase
+
+def hole(pid, last_retrive, reply=0):
+    return (pid, f"期末考试{pid}", 'text', '2024-01-01 12:00:00', reply, 0, last_retrive)
+
+def day_database(directory, date):
+    db = SQLDatabase(os.path.join(directory, f"{date}_holes_day.db"), remove_exisited=False)
+    db.create_holes_table()
+    db.create_comments_table()
+    return db
+
+def archived(archive, pid):
+    return archive.conn.execute("SELECT reply, last_retrive, archived FROM holes WHERE pid=?", (pid,)).fetchone()
+
+def check_late_commit(tmp):
+    # a worker commits a row retrived a few minutes before rows another worker committed earlier
+    db = day_database(tmp, '2024-01-01')
+    db.upsert_holes([hole(1, '2024-01-01 12:00:00'), hole(2, '2024-01-01 12:30:00')])
+    archive = Archive(tmp)
+    assert archive.update() == {'holes': 2, 'comments': 0}
+    db.upsert_holes([hole(3, '2024-01-01 12:25:00')])
+    db.insert_comments([(30, 3, 'text', '洞主', '2024-01-01 12:20:00', 'nan', '2024-01-01 12:25:00')])
+    assert archive.update() == {'holes': 1, 'comments': 1}
+    assert archived(archive, 3) == (0, '2024-01-01 12:25:00', 2), archived(archive, 3)
+    assert [pid for pid, in archive.conn.execute("SELECT pid FROM holes ORDER BY pid")] == [1, 2, 3]
+    archive.close()
+    db.close()
+
+def check_unchanged_sources(tmp):
+    # the overlap re-reads rows copied before, they are neither counted nor stamped with the new run
+    for date in ('2024-01-01', '2024-01-02'):
+        db = day_database(tmp, date)
+        db.upsert_holes([hole(int(date[-1]), f"{date} 12:00:00")])
+        db.close()
+    archive = Archive(tmp)
+    assert archive.update() == {'holes': 2, 'comments': 0}
+    assert archive.update() == {'holes': 0, 'comments': 0}
+    assert archived(archive, 1)[2] == 1 and archived(archive, 2)[2] == 1
+    archive.close()
+
+def check_newer_copy_wins(tmp):
+    # the same hole crawled on two days, the later retrive is kept whichever source is read last
+    first = day_database(tmp, '2024-01-01')
+    second = day_database(tmp, '2024-01-02')
+    first.upsert_holes([hole(1, '2024-01-01 12:00:00', reply=1)])
+    second.upsert_holes([hole(1, '2024-01-02 12:00:00', reply=5)])
+    archive = Archive(tmp)
+    archive.update()
+    assert archived(archive, 1)[:2] == (5, '2024-01-02 12:00:00'), archived(archive, 1)
+    first.upsert_holes([hole(1, '2024-01-01 13:00:00', reply=2)])
+    archive.update()
+    assert archived(archive, 1)[:2] == (5, '2024-01-02 12:00:00'), archived(archive, 1)
+    archive.close()
+    first.close()
+    second.close()
+
+def main():
+    for check in (check_late_commit, check_unchanged_sources, check_newer_copy_wins):
+        with tempfile.TemporaryDirectory() as tmp:
+            check(tmp)
+        print(f"{check.__name__:24s} ok")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+# day mode crawl edge cases against benchmarks/mock_server.py: when the crawl stops, failed comment threads,
+# and the checkpoint after a failed worker process
+# usage: python -m benchmarks.check_day
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import Future
+
+from benchmarks.bench_crawler import build_parser, make_crawler, start_mock_server
+from networks.loop import COMMENT_RETRIES
+from networks.utils import HoleDeleted
+
+def record(pid, timestamp, reply=0, top=False):
+    return {'pid': pid, 'text': f"树洞{pid}", 'type': 'text', 'timestamp': timestamp, 'time': '2024-01-01 12:00:00',
+            'reply': reply, 'likenum': 0, 'last_retrive': '2024-01-01 12:01:00', 'is_top': top}
+
+def stored_pids(crawler):
+    crawler.writer.flush()
+    return sorted(pid for pid, in crawler.db.conn.execute("SELECT pid FROM holes"))
+
+def check_pinned_posts(url, data_dir, args):
+    # a pinned old hole on page 1 and out-of-order old posts do not end the crawl,
+    # the first page without a fresh regular post does
+    crawler = make_crawler('day', url, data_dir, args)
+    crawler.with_comments = False
+    now = int(time.time())
+    old = now - 3*86400
+    pages = {1: [record(1, old, top=True)] + [record(100 - i, now - i) for i in range(5)],
+             2: [record(90 - i, now - 100 - i) for i in range(4)] + [record(50, old)],
+             3: [record(80, now - 200), record(40, old, top=False)],
+             4: [record(30, old), record(2, now, top=True)],
+             5: [record(20, now)]}
+    requested = []
+    def get_tree_hole_records(page):
+        requested.append(page)
+        return pages.get(page, [])
+    crawler.client.get_tree_hole_records = get_tree_hole_records
+    progress = []
+    crawler.crawl_pages(1, 1, progress.append)
+    assert stored_pids(crawler) == [2, 80, 87, 88, 89, 90, 96, 97, 98, 99, 100], stored_pids(crawler)
+    assert progress == [5], progress
+    assert max(requested) <= 4 + crawler.prefetch_pages, requested
+    crawler.close()
+
+def check_failed_comments(url, data_dir, args):
+    # a thread failing once is fetched again and stored, a deleted hole is skipped,
+    # a thread that keeps failing stops the crawl before progress() moves past its page
+    crawler = make_crawler('day', url, data_dir, args)
+    now = int(time.time())
+    pages = {1: [record(10, now, reply=1), record(11, now - 1, reply=1), record(12, now - 2, reply=1)],
+             2: [record(13, now - 3, reply=1)],
+             3: [record(5, now - 4*86400)]}
+    crawler.client.get_tree_hole_records = lambda page: pages.get(page, [])
+    attempts = {}
+    def submit_comments(pid, reply_num):
+        attempts[pid] = attempts.get(pid, 0) + 1
+        error = None
+        if pid == 11 and attempts[pid] == 1:
+            error = RuntimeError("timeout")
+        elif pid == 12:
+            error = HoleDeleted("该树洞已被删除")
+        elif pid == 13 and failing:
+            error = RuntimeError("timeout")
+        future = Future()
+        rows = [(pid * 100, pid, 'text', '洞主', '2024-01-01 12:00:00', 'nan', '2024-01-01 12:01:00')]
+        future.set_result((pid, None if error else rows, error))
+        return future
+    crawler.client.submit_comments = submit_comments
+
+    failing = False
+    progress = []
+    crawler.crawl_pages(1, 1, progress.append)
+    crawler.writer.flush()
+    cids = sorted(cid for cid, in crawler.db.conn.execute("SELECT cid FROM comments"))
+    assert cids == [1000, 1100, 1300], cids
+    assert attempts == {10: 1, 11: 2, 12: 1, 13: 1}, attempts
+    assert progress == [4], progress
+
+    failing = True
+    attempts.clear()
+    crawler.db.conn.execute("DELETE FROM comments")
+    crawler.db.conn.commit()
+    crawler.changes.comment_watermarks.clear()
+    progress = []
+    try:
+        crawler.crawl_pages(1, 1, progress.append)
+    except RuntimeError as e:
+        assert '13' in str(e), e
+    else:
+        raise AssertionError("a comment thread failing for good did not stop the crawl")
+    assert attempts[13] == COMMENT_RETRIES + 1, attempts
+    assert progress == [], progress
+    crawler.close()
+
+def check_failed_worker(url, data_dir, args):
+    # worker processes that cannot log in exit non-zero, the per-shard cursor stays in the checkpoint
+    args.day_workers = 2
+    crawler = make_crawler('day', url, data_dir, args)
+    crawler.client.session_state = lambda: {}
+    try:
+        crawler.craw_treehole()
+    except RuntimeError as e:
+        assert '异常退出' in str(e), e
+    else:
+        raise AssertionError("craw_treehole finished although its workers failed")
+    finally:
+        crawler.close()
+    with open(os.path.join(data_dir, "checkpoint_day.json"), encoding='utf-8') as f:
+        cursor = json.load(f).get('day')
+    assert cursor is not None and cursor['pages'], cursor
+    crawler = make_crawler('day', url, data_dir, args)
+    assert crawler.day_cursor is not None and crawler.day_cursor['pages'] == cursor['pages'], crawler.day_cursor
+    crawler.close()
+
+def main(argv=None):
+    args = build_parser().parse_args(['--day-pages', '10'] + (argv or []))
+    proc, url = start_mock_server(args)
+    results = []
+    try:
+        for check in (check_pinned_posts, check_failed_comments, check_failed_worker):
+            with tempfile.TemporaryDirectory() as data_dir:
+                check(url, data_dir, args)
+            results.append(f"{check.__name__:24s} ok")
+    finally:
+        proc.terminate()
+        proc.wait()
+    print("====================================")
+    print("\n".join(results))
+
+if __name__ == '__main__':
+    main()
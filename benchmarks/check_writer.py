@@ -0,0 +1,89 @@
+# failure handling of networks/writer.py: failed batches are retried, a crashed writer thread is reported
+# usage: python -m benchmarks.check_writer
+import os
+import tempfile
+import threading
+import time
+
+from networks.database import SQLDatabase
+from networks.writer import DBWriter
+
+def hole(pid, reply=1):
+    return (pid, f"期末考试{pid}", 'text', '2024-01-01 12:00:00', reply, 0, '2024-01-01 12:01:00')
+
+def open_db(path, history=True):
+    db = SQLDatabase(path, remove_exisited=False)
+    db.create_holes_table()
+    db.create_comments_table()
+    if history:
+        db.create_history_table()
+    return db
+
+def raises(func, *args):
+    try:
+        func(*args)
+    except RuntimeError as e:
+        return str(e)
+    return None
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+def check_failed_batch_is_kept(tmp):
+    # the history table is missing, the batch fails as a whole and is committed once it exists
+    db = open_db(os.path.join(tmp, "retry.db"), history=False)
+    committed = []
+    writer = DBWriter(db, flush_interval=0.05, on_commit=lambda holes, comments: committed.append(len(holes)),
+                      retries=1)
+    writer.upsert_holes([hole(1)])
+    writer.insert_history([(1, '2024-01-01 12:01:00', 1, 0, 1, 0)])
+    assert raises(writer.flush) is not None, "flush did not report the failed batch"
+    assert committed == [] and db.conn.execute("SELECT COUNT(*) FROM holes").fetchone()[0] == 0
+    db.create_history_table()
+    wait_for(lambda: writer.error is None)
+    writer.flush()
+    assert committed == [1], committed
+    assert db.conn.execute("SELECT COUNT(*) FROM holes").fetchone()[0] == 1
+    assert db.conn.execute("SELECT COUNT(*) FROM hole_history").fetchone()[0] == 1
+    writer.close()
+    db.close()
+
+def check_crash_is_reported(tmp):
+    # a row sqlite cannot bind kills the thread, every later write and flush raises instead of blocking
+    db = open_db(os.path.join(tmp, "crash.db"))
+    writer = DBWriter(db, max_queue=1, flush_interval=0.05)
+    writer.upsert_holes([hole(1, reply=2**70)])
+    wait_for(lambda: not writer._thread.is_alive())
+    assert isinstance(writer.error, OverflowError), writer.error
+    results = []
+    caller = threading.Thread(target=lambda: results.extend(raises(writer.upsert_holes, [hole(i)]) for i in range(5)),
+                              daemon=True)
+    caller.start()
+    caller.join(5)
+    assert not caller.is_alive(), "upsert_holes blocked on the queue of a dead writer"
+    assert all(results) and len(results) == 5, results
+    assert raises(writer.flush) is not None, "flush returned after the writer died"
+    writer.close()
+    db.close()
+
+def check_on_commit_error_is_reported(tmp):
+    db = open_db(os.path.join(tmp, "on_commit.db"))
+    def on_commit(holes, comments):
+        raise ValueError("on_commit")
+    writer = DBWriter(db, flush_interval=0.05, on_commit=on_commit)
+    writer.upsert_holes([hole(1)])
+    assert "on_commit" in (raises(writer.flush) or ''), "flush did not report the on_commit error"
+    writer.close()
+    db.close()
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        for check in (check_failed_batch_is_kept, check_crash_is_reported, check_on_commit_error_is_reported):
+            check(tmp)
+            print(f"{check.__name__:36s} ok")
+
+if __name__ == '__main__':
+    main()
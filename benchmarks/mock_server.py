@@ -0,0 +1,214 @@
+# offline stand-in for the TreeHole API, serves the endpoints in TreeHoleURLs
+# usage: python -m benchmarks.mock_server --port 8765 --latency 0.05 --error-rate 0.01
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+CHARS = "的一是了我不人在他有这个上们来到时大地为子中你说生国年着就那和要她出也得里后自以会家可下而过天去能对小多然于心学么之都好看起发当没成只如事把还用第样道想作种开美总从无情己面最女但现前些所同日手又行意动方期它头经长儿回位分爱老因很给名法间斯知世什两次使身者被高已亲其进此话常与活正感见明问力理尔点文几定本公特做外孩相西果走将月十实向声车全信重三机工物气每并别真打太新比才便夫再书部水像眼等体却加电主界门利海受听表德少克代员许先口由死安写性马光白或住难望教命花结乐色更拉东神记处让母父应直字场平报友关放至张认接告入笑内英军候民岁往何度山觉路带万男边风解叫任金快原吃妈变通师立象数四失满战远格士音轻目条呢"
+NAMES = ["洞主", "Alice", "Bob", "Carol", "Dave", "Eve", "Francis", "Grace", "Hans", "Isabella"]
+
+class TreeHoleWorld(object):
+    # deterministic synthetic data: holes are posted every hole_interval seconds back from start,
+    # replies grow with the age of a hole until max_reply
+    def __init__(self, hole_interval=60.0, reply_period=120.0, max_reply=60, text_len=80,
+                 comment_len=30, delete_rate=0.0, seed=0):
+        self.start = time.time()
+        self.base_pid = 6000000
+        self.hole_interval = hole_interval
+        self.reply_period = reply_period
+        self.max_reply = max_reply
+        self.text_len = text_len
+        self.comment_len = comment_len
+        self.delete_rate = delete_rate
+        self.seed = seed
+
+    def latest_pid(self, now):
+        return self.base_pid + int((now - self.start) / self.hole_interval)
+
+    def timestamp(self, pid):
+        return int(self.start + (pid - self.base_pid) * self.hole_interval)
+
+    def text(self, key, length):
+        rng = random.Random(key)
+        return ''.join(rng.choice(CHARS) for _ in range(rng.randint(length // 2, length * 3 // 2)))
+
+    def reply(self, pid, now):
+        age = max(0, now - self.timestamp(pid))
+        cap = random.Random(pid ^ self.seed).randint(0, self.max_reply)
+        return min(cap, int(age / self.reply_period))
+
+    def deleted(self, pid):
+        return random.Random(pid * 31 + self.seed).random() < self.delete_rate
+
+    def hole(self, pid, now):
+        reply = self.reply(pid, now)
+        return {'pid': pid, 'text': self.text(pid, self.text_len), 'type': 'text', 'timestamp': self.timestamp(pid),
+                'reply': reply, 'likenum': reply // 3 + pid % 5, 'extra': 0, 'anonymous': 1, 'is_top': 0,
+                'label': 0, 'status': 0, 'is_comment': 1, 'tag': None}
+
+    def comment(self, pid, k):
+        cid = pid * 1000 + k
+        return {'cid': cid, 'pid': pid, 'text': self.text(cid, self.comment_len), 'name': NAMES[k % len(NAMES)],
+                'timestamp': self.timestamp(pid) + int((k + 1) * self.reply_period),
+                'comment_id': None if k % 4 else pid * 1000 + k // 2, 'tag': None, 'quote': None}
+
+    def page(self, page, limit, now):
+        top = self.latest_pid(now) - (page - 1) * limit
+        return [self.hole(pid, now) for pid in range(top, top - limit, -1)]
+
+    def comments(self, pid, now):
+        return [self.comment(pid, k) for k in range(self.reply(pid, now))]
+
+def paginate(items, page, limit):
+    last_page = max(1, (len(items) + limit - 1) // limit)
+    return {'current_page': page, 'data': items[(page - 1) * limit:page * limit], 'last_page': last_page,
+            'per_page': limit, 'total': len(items)}
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload, headers=()):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in headers:
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.count('bytes', len(body))
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def maybe_fail(self):
+        server = self.server
+        if self.headers.get('Authorization') != 'Bearer mock-jwt-token':
+            self.server.count('401')
+            self.send_json(401, {'code': 40100, 'message': '请登录', 'success': False})
+            return True
+        if server.latency:
+            time.sleep(server.latency * random.uniform(0.5, 1.5))
+        roll = random.random()
+        if roll < server.error_rate / 2:
+            self.server.count('5xx')
+            self.send_json(500, {'message': 'Server Error'})
+            return True
+        if roll < server.error_rate:
+            self.server.count('unsuccessful')
+            self.send_json(200, {'code': 40001, 'message': '请求过于频繁', 'success': False})
+            return True
+        return False
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        self.read_body()
+        self.server.count(path)
+        if path == '/api/login':
+            self.send_json(200, {'code': 20000, 'data': {'jwt': 'mock-jwt-token'}, 'success': True})
+        elif path == '/api/jwt_send_msg':
+            self.send_json(200, {'code': 20000, 'message': '验证码已发送', 'success': True})
+        elif path == '/api/jwt_msg_verify':
+            self.send_json(200, {'code': 20000, 'message': '登录成功', 'success': True})
+        elif path.startswith('/notify'): # server chan stub
+            self.send_json(200, {'code': 0, 'message': '', 'data': {}})
+        else:
+            self.send_json(404, {'message': 'Not Found'})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        world = self.server.world
+        now = time.time()
+        if url.path == '/version':
+            self.server.count(url.path)
+            self.send_json(200, {'version': 'mock'}, [
+                ('Set-Cookie', 'XSRF-TOKEN=mock-xsrf; expires=Thu, 01 Jan 2099 00:00:00 GMT; path=/, '
+                               '_session=mock-session; expires=Thu, 01 Jan 2099 00:00:00 GMT; path=/; httponly')])
+        elif url.path == '/_stats':
+            self.send_json(200, self.server.snapshot())
+        elif url.path == '/api/pku_hole':
+            self.server.count(url.path)
+            if self.maybe_fail():
+                return
+            page, limit = int(query.get('page', 1)), int(query.get('limit', 25))
+            holes = world.page(page, limit, now)
+            self.server.count('holes', len(holes))
+            self.send_json(200, {'code': 20000, 'data': {'current_page': page, 'data': holes, 'last_page': 100000},
+                                 'success': True})
+        elif url.path.startswith('/api/pku_comment_v3/'):
+            self.server.count('/api/pku_comment_v3')
+            if self.maybe_fail():
+                return
+            pid = int(url.path.rsplit('/', 1)[-1])
+            if world.deleted(pid):
+                self.send_json(200, {'code': 40002, 'message': '该树洞已被删除', 'success': False})
+                return
+            comments = world.comments(pid, now)
+            if query.get('sort') == 'desc':
+                comments.reverse()
+            data = paginate(comments, int(query.get('page', 1)), int(query.get('limit', 10)))
+            self.server.count('comments', len(data['data']))
+            self.send_json(200, {'code': 20000, 'data': data, 'success': True})
+        else:
+            self.send_json(404, {'message': 'Not Found'})
+
+class MockTreeHoleServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, world, latency=0.0, error_rate=0.0):
+        super().__init__(address, MockHandler)
+        self.world = world
+        self.latency = latency
+        self.error_rate = error_rate
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def count(self, key, n=1):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + n
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Mock TreeHole server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help="mean seconds added to each API request")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of API requests that fail")
+    parser.add_argument('--delete-rate', type=float, default=0.0, help="share of holes reported as deleted")
+    parser.add_argument('--hole-interval', type=float, default=60.0, help="seconds between synthetic posts")
+    parser.add_argument('--reply-period', type=float, default=120.0, help="seconds between replies of a hole")
+    parser.add_argument('--max-reply', type=int, default=60)
+    parser.add_argument('--text-len', type=int, default=80, help="mean characters per post")
+    parser.add_argument('--comment-len', type=int, default=30, help="mean characters per comment")
+    return parser
+
+def make_server(args):
+    world = TreeHoleWorld(args.hole_interval, args.reply_period, args.max_reply, args.text_len,
+                          args.comment_len, args.delete_rate)
+    return MockTreeHoleServer((args.host, args.port), world, args.latency, args.error_rate)
+
+if __name__ == '__main__':
+    server = make_server(build_parser().parse_args())
+    print(f"mock TreeHole serving on {server.url}", flush=True)
+    server.serve_forever()
@@ -1,11 +1,95 @@
-from datetime import datetime
-from networks.loop import Crawler
+import argparse
+import signal
+import sys
 
-if __name__ == '__main__':
+# usage: python main.py [-c config.ini] [monitor|day|export|stats|search] [options]
+# without a command the mode in [Mode] of the config file is run
+# modules are imported per command, export/stats/search never load the crawler or pandas
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='main.py', description="PKU TreeHole crawler and monitor")
+    parser.add_argument('-c', '--config', help="config file, default is config.ini next to main.py")
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.add_parser('monitor', help="monitor new holes, [Monitor] module")
+    day = commands.add_parser('day', help="crawl the holes of the last days, [Day] module")
+    day.add_argument('--days', type=int, help="num_days")
+    day.add_argument('--workers', type=int, help="day_workers, worker processes splitting the pages")
+    export = commands.add_parser('export', help="archive every day database and export new rows, [Export] module")
+    export.add_argument('--format', choices=('csv', 'parquet'))
+    export.add_argument('--out-dir')
+    stats = commands.add_parser('stats', help="hourly activity, hotness and top terms, [Stats] module")
+    stats.add_argument('--database', help="database file, or archive")
+    stats.add_argument('--table', choices=('holes', 'comments'))
+    search = commands.add_parser('search', help="full-text search over crawled data, [Search] module")
+    search.add_argument('key_words', nargs='*', help="key words that all have to appear")
+    search.add_argument('--database', help="database file, or archive")
+    search.add_argument('--table', choices=('holes', 'comments'))
+    search.add_argument('--start', help="yyyy-mm-dd HH:MM:SS")
+    search.add_argument('--end', help="yyyy-mm-dd HH:MM:SS")
+    search.add_argument('--limit', type=int)
+    return parser
+
+def overrides(args) -> dict:
+    # command line options as {section: {key: value}} on top of the config file
+    options = {
+        ('Day', 'num_days'): getattr(args, 'days', None),
+        ('Day', 'day_workers'): getattr(args, 'workers', None),
+        ('Export', 'format'): getattr(args, 'format', None),
+        ('Export', 'out_dir'): getattr(args, 'out_dir', None),
+        (args.command.capitalize() if args.command else '', 'database'): getattr(args, 'database', None),
+        (args.command.capitalize() if args.command else '', 'table'): getattr(args, 'table', None),
+        ('Search', 'start'): getattr(args, 'start', None),
+        ('Search', 'end'): getattr(args, 'end', None),
+        ('Search', 'limit'): getattr(args, 'limit', None),
+    }
+    if getattr(args, 'key_words', None):
+        options[('Search', 'key_words')] = f"[{' '.join(args.key_words)}]"
+    if args.command:
+        options[('Mode', 'mode')] = args.command
+    sections = {}
+    for (section, key), value in options.items():
+        if value is not None:
+            sections.setdefault(section, {})[key] = str(value)
+    return sections
+
+def run_crawler():
+    from networks.loop import Crawler
+    # turn SIGTERM into a normal exit so pending rows get flushed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     crawler = Crawler()
-    crawler.login()
-    if crawler.login_status == True:
-        if crawler.mode == 'monitor':
-            crawler.monitor_treehole()
-        elif crawler.mode == 'day':
-            crawler.craw_treehole()
\ No newline at end of file
+    try:
+        crawler.login()
+        if crawler.login_status == True:
+            if crawler.mode == 'monitor':
+                crawler.monitor_treehole()
+            elif crawler.mode == 'day':
+                crawler.craw_treehole()
+    except KeyboardInterrupt:
+        print("收到中断信号，正在保存数据")
+    finally:
+        crawler.close()
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    from networks.config import load_config
+    try:
+        settings = load_config(args.config, overrides(args))
+    except ValueError as e:
+        print(e)
+        return 2
+    mode = settings['Mode']['mode']
+    if mode == 'search':
+        from networks.search import search_treehole
+        search_treehole()
+    elif mode == 'export':
+        from networks.export import export_treehole
+        export_treehole()
+    elif mode == 'stats':
+        from networks.analysis import analyze_treehole
+        analyze_treehole()
+    else:
+        run_crawler()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
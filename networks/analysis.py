@@ -0,0 +1,233 @@
+import json
+import multiprocessing
+import os
+import re
+import time
+
+import numpy as np
+
+from .archive import data_dir
+from .config import settings
+from .database import SQLDatabase
+from .search import latest_database
+
+try:
+    import jieba
+except ImportError: # optional, character bigrams are used instead
+    jieba = None
+
+# source table -> (key column, token cache table)
+TOKEN_TABLES = {'holes': ('pid', 'hole_tokens'), 'comments': ('cid', 'comment_tokens')}
+USELESS_STR = set('''一！“”，。？、；’"',.、·《》（）()#\t：\n\r/ ''')
+STOPWORDS_FILE = os.path.join(os.path.dirname(__file__), "../Analysis/baidu_stopwords.txt")
+_RUNS = re.compile(r'[一-鿿]+|[A-Za-z0-9_]+')
+
+_stopwords = frozenset()
+
+def load_stopwords(path=STOPWORDS_FILE) -> frozenset:
+    if not path or not os.path.exists(path):
+        return frozenset()
+    with open(path, encoding='utf-8') as f:
+        return frozenset(f.read().splitlines())
+
+def _init_worker(stopwords):
+    global _stopwords
+    _stopwords = stopwords
+    if jieba is not None:
+        jieba.setLogLevel(60)
+        jieba.initialize()
+
+def segment(text:str) -> list:
+    # jieba words, or latin words and chinese character bigrams when jieba is not installed
+    if jieba is not None:
+        words = jieba.lcut(text)
+    else:
+        words = []
+        for run in _RUNS.findall(text):
+            if run[0] < '一':
+                words.append(run.lower())
+            else:
+                words.extend(run[i:i+2] for i in range(max(1, len(run) - 1)))
+    return [w for w in words if w not in _stopwords and w not in USELESS_STR]
+
+def _segment_rows(rows) -> list:
+    return [(key, ' '.join(segment(text or ''))) for key, text in rows]
+
+class TokenCache(object):
+    # segmented text of every pid/cid in {hole,comment}_tokens next to the crawled rows,
+    # only rows without cached tokens are segmented, spread over {processes} worker processes
+    def __init__(self, db, table_name='holes', processes=0, chunk_rows=10000, stopwords=frozenset()):
+        self.db = db
+        self.table_name = table_name
+        self.key, self.cache_table = TOKEN_TABLES[table_name]
+        self.processes = processes or os.cpu_count() or 1
+        self.chunk_rows = chunk_rows
+        self.stopwords = stopwords
+        with self.db.conn:
+            self.db.conn.execute(f"CREATE TABLE IF NOT EXISTS {self.cache_table} ({self.key} INTEGER PRIMARY KEY, tokens TEXT)")
+
+    def update(self) -> int:
+        # returns the number of newly segmented rows
+        conn = self.db.conn
+        sql = f'''SELECT {self.key}, text FROM {self.table_name}
+                  WHERE {self.key} > ? AND {self.key} NOT IN (SELECT {self.key} FROM {self.cache_table})
+                  ORDER BY {self.key} LIMIT ?'''
+        last, total, pool = -1, 0, None
+        if self.processes <= 1:
+            _init_worker(self.stopwords)
+        try:
+            while True:
+                rows = conn.execute(sql, (last, self.chunk_rows)).fetchall()
+                if not rows:
+                    break
+                last = rows[-1][0]
+                if self.processes > 1 and pool is None:
+                    pool = multiprocessing.Pool(self.processes, _init_worker, (self.stopwords,))
+                if pool is None:
+                    tokens = _segment_rows(rows)
+                else:
+                    size = max(1, len(rows) // (self.processes * 4))
+                    tokens = [row for part in pool.imap(_segment_rows, [rows[i:i+size] for i in range(0, len(rows), size)])
+                              for row in part]
+                with conn:
+                    conn.executemany(f"INSERT OR REPLACE INTO {self.cache_table} VALUES (?, ?)", tokens)
+                total += len(rows)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        return total
+
+def _time_filter(start, end, column='time'):
+    where, params = [], []
+    if start:
+        where.append(f"{column} >= ?")
+        params.append(start)
+    if end:
+        where.append(f"{column} <= ?")
+        params.append(end)
+    return (" WHERE " + " AND ".join(where)) if where else "", params
+
+def hourly_activity(db, table_name='holes', start=None, end=None, chunk_rows=100000):
+    # posts per hour of day and their mean hotness (reply*likenum, holes only)
+    where, params = _time_filter(start, end)
+    hot = "reply*likenum" if table_name == 'holes' else "0"
+    cur = db.conn.execute(f"SELECT CAST(substr(time, 12, 2) AS INTEGER), {hot} FROM {table_name}{where}", params)
+    counts = np.zeros(24, dtype=np.int64)
+    hot_sum = np.zeros(24)
+    while True:
+        rows = cur.fetchmany(chunk_rows)
+        if not rows:
+            break
+        chunk = np.array(rows, dtype=np.int64)
+        counts += np.bincount(chunk[:, 0], minlength=24)
+        hot_sum += np.bincount(chunk[:, 0], weights=chunk[:, 1], minlength=24)
+    return counts, np.divide(hot_sum, counts, out=np.zeros(24), where=counts > 0)
+
+def hotness_stats(db, start=None, end=None, top=10) -> dict:
+    where, params = _time_filter(start, end)
+    hot = np.fromiter((h for h, in db.conn.execute(f"SELECT reply*likenum FROM holes{where}", params)), dtype=np.int64)
+    if not len(hot):
+        return {'count': 0}
+    p50, p90, p99 = np.percentile(hot, [50, 90, 99])
+    hottest = db.conn.execute(f"SELECT pid, reply*likenum AS hot, reply, likenum, time, text FROM holes{where} "
+                              "ORDER BY hot DESC LIMIT ?", params + [top]).fetchall()
+    return {'count': int(len(hot)), 'mean': float(hot.mean()), 'p50': float(p50), 'p90': float(p90),
+            'p99': float(p99), 'max': int(hot.max()), 'zero': int((hot == 0).sum()), 'hottest': hottest}
+
+def top_terms(db, table_name='holes', top=20, hot_boost=2, start=None, end=None, chunk_rows=50000) -> list:
+    # terms with the largest tf-idf sums, same weighting as TfidfVectorizer (smooth idf, l2 rows, 2+ character
+    # terms) with hot holes (log(hot) > 1) counted 1+{hot_boost} times like the notebook did
+    # computed from (doc, term) id arrays in two passes over the token cache, the matrix is never built
+    key, cache_table = TOKEN_TABLES[table_name]
+    where, params = _time_filter(start, end, 't.time')
+    hot = "t.reply*t.likenum" if table_name == 'holes' else "0"
+    sql = f"SELECT c.tokens, {hot} FROM {cache_table} c JOIN {table_name} t ON t.{key} = c.{key}{where}"
+    vocab = {}
+
+    def chunks():
+        cur = db.conn.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(chunk_rows)
+            if not rows:
+                return
+            docs, terms, weights = [], [], np.empty(len(rows))
+            for i, (tokens, hotness) in enumerate(rows):
+                ids = [vocab.setdefault(w, len(vocab)) for w in tokens.lower().split() if len(w) >= 2]
+                docs.extend([i] * len(ids))
+                terms.extend(ids)
+                weights[i] = 1 + hot_boost if hotness > np.e else 1
+            yield np.array(docs, dtype=np.int64), np.array(terms, dtype=np.int64), weights
+
+    # pass 1: weighted document frequencies
+    df = np.zeros(0)
+    n_docs = 0.0
+    for docs, terms, weights in chunks():
+        pairs = np.unique(docs << 32 | terms)
+        counts = np.bincount(pairs & 0xffffffff, weights=weights[pairs >> 32], minlength=len(vocab))
+        df = np.concatenate([df, np.zeros(len(vocab) - len(df))]) + counts
+        n_docs += weights.sum()
+    if not vocab:
+        return []
+    idf = np.log((1 + n_docs) / (1 + df)) + 1
+    # pass 2: l2 normalized tf-idf of every (doc, term) pair, summed per term
+    sums = np.zeros(len(vocab))
+    for docs, terms, weights in chunks():
+        pairs, tf = np.unique(docs << 32 | terms, return_counts=True)
+        doc, term = pairs >> 32, pairs & 0xffffffff
+        w = tf * idf[term]
+        norm = np.sqrt(np.bincount(doc, weights=w * w, minlength=len(weights)))
+        sums += np.bincount(term, weights=w / norm[doc] * weights[doc], minlength=len(vocab))
+    top = min(top, len(sums))
+    best = np.argpartition(-sums, top - 1)[:top]
+    best = best[np.argsort(-sums[best])]
+    wanted = set(best.tolist())
+    words = {i: w for w, i in vocab.items() if i in wanted}
+    return [(words[i], float(sums[i])) for i in best]
+
+def analyze_treehole():
+    options = settings['Stats']
+    table_name = options['table']
+    start = options['start'] or None
+    end = options['end'] or None
+    database_name = options['database'] or latest_database()
+    if database_name == 'archive':
+        database_name = os.path.join(data_dir(), "archive.db")
+    if not os.path.exists(database_name):
+        print(f"数据库 {database_name} 不存在")
+        return
+    processes = options['processes']
+    stopwords = load_stopwords(options['stopwords'] or STOPWORDS_FILE)
+    json_file = options['json_file'] or None
+
+    db = SQLDatabase(database_name, remove_exisited=False)
+    begin = time.perf_counter()
+    if jieba is None:
+        print("未安装 jieba，按字符二元组分词")
+    segmented = TokenCache(db, table_name, processes, stopwords=stopwords).update()
+    print(f"{database_name}: 新分词 {segmented} 条，用时 {time.perf_counter() - begin:.1f} s")
+
+    counts, mean_hot = hourly_activity(db, table_name, start, end)
+    print("====================================")
+    print("hour\tcount\tmean hot")
+    for hour in range(24):
+        print(f"{hour:02d}\t{counts[hour]}\t{mean_hot[hour]:.1f}")
+    stats = {}
+    if table_name == 'holes':
+        stats = hotness_stats(db, start, end)
+        print("====================================")
+        print("\t".join(f"{k}: {v:.1f}" if isinstance(v, float) else f"{k}: {v}"
+                        for k, v in stats.items() if k != 'hottest'))
+        for pid, hot, reply, likenum, post_time, text in stats.get('hottest', []):
+            print(f"{pid}\t{hot}\t{post_time}\t{text[:40]}")
+    terms = top_terms(db, table_name, options['top_terms'], options['hot_boost'], start, end)
+    print("====================================")
+    for term, score in terms:
+        print(f"{term}: {score:.3f}")
+    print(f"用时 {time.perf_counter() - begin:.1f} s")
+    db.close()
+    if json_file:
+        with open(json_file, 'w', encoding='utf-8') as f:
+            json.dump({'database': database_name, 'table': table_name, 'hourly_count': counts.tolist(),
+                       'hourly_mean_hot': mean_hot.tolist(), 'hotness': stats, 'top_terms': terms},
+                      f, ensure_ascii=False, indent=2)
@@ -0,0 +1,107 @@
+import glob
+import os
+import re
+import time
+
+from .config import settings
+from .database import SQLDatabase, index_pending
+
+# a row can be committed well after its last_retrive (write backlog, day mode workers waiting for the lock),
+# so every run reads the source again from OVERLAP seconds before its watermark, the copies are idempotent
+OVERLAP = 60*60
+DAY_DATABASE = re.compile(r'(\d{4}-\d{2}-\d{2})_holes_\w+\.db$')
+
+# newest copy of a hole wins, whichever day database it comes from
+HOLES_ARCHIVE = '''INSERT INTO holes (pid, text, type, time, reply, likenum, last_retrive, archived)
+                        SELECT pid, text, type, time, reply, likenum, last_retrive, ? FROM src.holes
+                        WHERE last_retrive > ?
+                        ON CONFLICT(pid) DO UPDATE SET
+                        text=excluded.text, type=excluded.type, time=excluded.time, reply=excluded.reply,
+                        likenum=excluded.likenum, last_retrive=excluded.last_retrive, archived=excluded.archived
+                        WHERE excluded.last_retrive > holes.last_retrive'''
+COMMENTS_ARCHIVE = '''INSERT INTO comments (cid, pid, text, name, time, comment_id, last_retrive, archived)
+                        SELECT cid, pid, text, name, time, comment_id, last_retrive, ? FROM src.comments
+                        WHERE last_retrive > ?
+                        ON CONFLICT(cid) DO NOTHING'''
+
+def data_dir() -> str:
+    return settings['Defaults']['data_dir'] or os.path.join(os.path.dirname(__file__), "../data")
+
+def overlap_start(watermark) -> str:
+    # watermark - OVERLAP, both 'YYYY-mm-dd HH:MM:SS'
+    start = time.mktime(time.strptime(watermark, '%Y-%m-%d %H:%M:%S')) - OVERLAP
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start))
+
+def day_databases(directory, start=None, end=None) -> list:
+    # "{date}_holes_{mode}.db" files, oldest first, optionally only dates within [start, end]
+    databases = []
+    for path in sorted(glob.glob(os.path.join(directory, "*_holes_*.db"))):
+        match = DAY_DATABASE.search(os.path.basename(path))
+        if match is None:
+            continue
+        date = match.group(1)
+        if (start and date < start[:10]) or (end and date > end[:10]):
+            continue
+        databases.append(path)
+    return databases
+
+class Archive(object):
+    # all day databases merged into one, holes and comments of every day are queried like a single crawl
+    # each source is ATTACHed in turn and copied in SQL (SQLite attaches at most 10 databases at once),
+    # only rows retrived since the previous run of that source are read
+    def __init__(self, directory=None, name="archive.db"):
+        self.directory = directory or data_dir()
+        self.db = SQLDatabase(os.path.join(self.directory, name), remove_exisited=False)
+        self.db.create_holes_table()
+        self.db.create_comments_table()
+        self.conn = self.db.conn
+        with self.conn:
+            for table_name in ('holes', 'comments'):
+                columns = [row[1] for row in self.conn.execute(f"PRAGMA table_info({table_name})")]
+                if 'archived' not in columns: # run that last copied the row, drives incremental exports
+                    self.conn.execute(f"ALTER TABLE {table_name} ADD COLUMN archived INTEGER")
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS {table_name}_archived ON {table_name}(archived)")
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS archive_sources
+                        (database TEXT,
+                        table_name TEXT,
+                        last_retrive TEXT,
+                        PRIMARY KEY (database, table_name))''')
+            self.conn.execute("CREATE TABLE IF NOT EXISTS archive_runs (run INTEGER PRIMARY KEY, time TEXT)")
+
+    def close(self):
+        self.db.close()
+
+    def last_run(self) -> int:
+        return self.conn.execute("SELECT COALESCE(MAX(run), 0) FROM archive_runs").fetchone()[0]
+
+    def update(self, databases=None) -> dict:
+        # copy new and changed rows of every day database, returns rows copied per table
+        # rows copied before are skipped by the upserts and keep their archived run
+        databases = day_databases(self.directory) if databases is None else databases
+        with self.conn:
+            run = self.conn.execute("INSERT INTO archive_runs (time) VALUES (?)",
+                                    (time.strftime('%Y-%m-%d %H:%M:%S'),)).lastrowid
+        copied = {'holes': 0, 'comments': 0}
+        for path in databases:
+            name = os.path.basename(path)
+            self.conn.execute("ATTACH DATABASE ? AS src", (path,))
+            try:
+                with self.conn:
+                    for table_name, sql in (('holes', HOLES_ARCHIVE), ('comments', COMMENTS_ARCHIVE)):
+                        if self.conn.execute("SELECT 1 FROM src.sqlite_master WHERE name=?", (table_name,)).fetchone() is None:
+                            continue
+                        row = self.conn.execute("SELECT last_retrive FROM archive_sources WHERE database=? AND table_name=?",
+                                                (name, table_name)).fetchone()
+                        since = '' if row is None else overlap_start(row[0])
+                        copied[table_name] += self.conn.execute(sql, (run, since)).rowcount
+                        newest = self.conn.execute(f"SELECT MAX(last_retrive) FROM src.{table_name} WHERE last_retrive > ?",
+                                                   (since,)).fetchone()[0]
+                        if newest is not None and (row is None or newest > row[0]):
+                            self.conn.execute("INSERT OR REPLACE INTO archive_sources VALUES (?, ?, ?)",
+                                              (name, table_name, newest))
+                    if self.db.fts:
+                        index_pending(self.conn, 'holes', 'pid')
+                        index_pending(self.conn, 'comments', 'cid')
+            finally:
+                self.conn.execute("DETACH DATABASE src")
+        return copied
@@ -0,0 +1,69 @@
+import threading
+
+from .metrics import metrics
+
+class ChangeDetector(object):
+    # remembers what is already stored so only rows that really changed are written
+    # holes: pid -> (hash of text and type, reply, likenum), comments: pid -> highest stored cid
+    # rows handed to the writer stay pending until committed() is called for them by the writer thread,
+    # only then they count as stored
+    def __init__(self, with_history=False):
+        self.with_history = with_history
+        self.holes = {}
+        self.comment_watermarks = {}
+        self.pending_holes = {}
+        self.pending_watermarks = {}
+        self._lock = threading.Lock()
+
+    def warm(self, db):
+        for pid, text, dtype, reply, likenum in db.conn.execute("SELECT pid, text, type, reply, likenum FROM holes"):
+            self.holes[pid] = (hash((text, dtype)), reply, likenum)
+        self.comment_watermarks.update(db.get_max_cids())
+
+    def changed_holes(self, rows):
+        # rows: (pid, text, type, time, reply, likenum, last_retrive)
+        # returns (changed rows, history rows) where history rows are (pid, time, reply, likenum, d_reply, d_likenum)
+        changed, history = [], []
+        with self._lock:
+            for row in rows:
+                pid, text, dtype, _, reply, likenum, last_retrive = row
+                state = (hash((text, dtype)), reply, likenum)
+                old = self.pending_holes.get(pid, self.holes.get(pid))
+                if old == state:
+                    continue
+                self.pending_holes[pid] = state
+                changed.append(row)
+                if self.with_history and (old is None or old[1:] != state[1:]):
+                    old_reply, old_likenum = (0, 0) if old is None else old[1:]
+                    history.append((pid, last_retrive, reply, likenum, reply - old_reply, likenum - old_likenum))
+        metrics.inc('db_rows_skipped_total', len(rows) - len(changed), table='holes')
+        return changed, history
+
+    def new_comments(self, rows):
+        # rows: (cid, pid, ...), comments are immutable so anything at or below the watermark is stored
+        fresh = []
+        with self._lock:
+            for row in rows:
+                if row[0] > max(self.pending_watermarks.get(row[1], -1), self.comment_watermarks.get(row[1], -1)):
+                    fresh.append(row)
+            for row in fresh:
+                if row[0] > self.pending_watermarks.get(row[1], -1):
+                    self.pending_watermarks[row[1]] = row[0]
+        metrics.inc('db_rows_skipped_total', len(rows) - len(fresh), table='comments')
+        return fresh
+
+    def committed(self, holes, comments):
+        # rows of a committed batch, same layout as above
+        with self._lock:
+            for row in holes:
+                pid = row[0]
+                state = (hash((row[1], row[2])), row[4], row[5])
+                self.holes[pid] = state
+                if self.pending_holes.get(pid) == state:
+                    del self.pending_holes[pid]
+            for row in comments:
+                cid, pid = row[0], row[1]
+                if cid > self.comment_watermarks.get(pid, -1):
+                    self.comment_watermarks[pid] = cid
+                if self.pending_watermarks.get(pid, -1) <= cid:
+                    self.pending_watermarks.pop(pid, None)
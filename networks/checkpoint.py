@@ -0,0 +1,34 @@
+import json
+import os
+import time
+
+class Checkpoint(object):
+    # crawler state as one json file, written to a temp file and renamed so a crash never leaves half of it
+    def __init__(self, path, interval=60):
+        self.path = path
+        self.interval = interval
+        self.saved_at = time.monotonic()
+
+    def load(self) -> dict:
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError):
+            print(f"检查点{self.path}无法读取，已忽略")
+            return {}
+
+    def save(self, state:dict):
+        tmp = self.path + '.tmp'
+        # holds the login tokens, readable by the owner only
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.saved_at = time.monotonic()
+
+    def due(self) -> bool:
+        return time.monotonic() - self.saved_at >= self.interval
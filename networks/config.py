@@ -1,5 +1,197 @@
 import configparser
 import os
 
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), "../config.ini")
+MODES = ('monitor', 'day', 'search', 'export', 'stats')
+
+# every option read by networks/: key -> (type, default, min, max), a tuple type lists the allowed values
+# options left out of the config file take the default, bool options are spelled True or False, list options "[a b c]"
+SCHEMA = {
+    'User': {
+        'uid': (str, None, None, None),
+        'password': (str, None, None, None),
+    },
+    'Mode': {
+        'mode': (MODES, 'monitor', None, None),
+    },
+    'Defaults': {
+        'page_interval': (int, 3, 0, None),
+        'remove_exisited': (bool, False, None, None),
+        'comments': (bool, True, None, None),
+        'workers': (int, 4, 1, None),
+        'rate_limit': (float, 2.0, 0, None),
+        'rate_burst': (int, 1, 1, None),
+        'retry_backoff': (float, 2.0, 0, None),
+        'write_queue': (int, 1000, 1, None),
+        'write_batch_rows': (int, 1000, 1, None),
+        'write_flush_interval': (float, 1.0, 0, None),
+        'hole_history': (bool, False, None, None),
+        'checkpoint': (bool, True, None, None),
+        'checkpoint_interval': (int, 60, 1, None),
+        'data_dir': (str, '', None, None),
+        'base_url': (str, '', None, None),
+    },
+    'Day': {
+        'num_days': (int, 1, 1, None),
+        'prefetch_pages': (int, 4, 1, None),
+        'day_workers': (int, 1, 1, None),
+    },
+    'Monitor': {
+        'get_interval': (int, 1, 0, None),
+        'search_pages': (int, 2, 1, None),
+        'morning_sleep': (bool, True, None, None),
+        'max_hole_actions': (int, 5, 1, None),
+        'min_poll_interval': (int, 20, 1, None),
+        'max_poll_interval': (int, 600, 1, None),
+        'request_budget': (int, 60, 0, None),
+        'monitor_key_words': (bool, False, None, None),
+        'monitor_live_key_words': (bool, True, None, None),
+        'show_hot': (bool, True, None, None),
+        'show_hot_num': (int, 5, 1, None),
+        'show_hot_time': (int, 21, 0, 23),
+    },
+    'Key_Words': {
+        'key_words': (str, '', None, None), # list or regular expression
+        'server_key': (str, '', None, None),
+        'posted_ttl': (float, 7.0, 0, None),
+        'posted_max': (int, 100000, 1, None),
+    },
+    'Live_Key_Words': {
+        'live_key_words': (list, [], None, None),
+        'negative_live_key_words': (list, [], None, None),
+    },
+    'Notify': {
+        'enabled': (bool, True, None, None),
+        'live_key_words': (bool, True, None, None),
+        'window': (float, 60.0, 0, None),
+        'min_gap': (float, 60.0, 0, None),
+        'retries': (int, 3, 0, None),
+        'backoff': (float, 5.0, 0, None),
+        'timeout': (float, 10.0, 0, None),
+        'url': (str, '', None, None),
+    },
+    'Metrics': {
+        'enabled': (bool, False, None, None),
+        'prometheus_file': (str, '', None, None),
+        'json_file': (str, '', None, None),
+        'interval': (int, 60, 1, None),
+        'port': (int, 0, 0, 65535),
+    },
+    'Search': {
+        'key_words': (list, [], None, None),
+        'table': (('holes', 'comments'), 'holes', None, None),
+        'start': (str, '', None, None),
+        'end': (str, '', None, None),
+        'limit': (int, 50, 1, None),
+        'database': (str, '', None, None),
+    },
+    'Export': {
+        'format': (('csv', 'parquet'), 'csv', None, None),
+        'out_dir': (str, '', None, None),
+        'chunk_rows': (int, 50000, 1, None),
+        'compression': (str, 'zstd', None, None),
+    },
+    'Stats': {
+        'database': (str, '', None, None),
+        'table': (('holes', 'comments'), 'holes', None, None),
+        'start': (str, '', None, None),
+        'end': (str, '', None, None),
+        'processes': (int, 0, 0, None), # 0 for one per cpu
+        'stopwords': (str, '', None, None),
+        'top_terms': (int, 20, 1, None),
+        'hot_boost': (int, 2, 0, None),
+        'json_file': (str, '', None, None),
+    },
+}
+# options without a usable default, per mode
+CRAWLER_OPTIONS = {'User': ('uid', 'password')}
+REQUIRED = {
+    'monitor': CRAWLER_OPTIONS,
+    'day': CRAWLER_OPTIONS,
+    'search': {'Search': ('key_words',)},
+    'export': {},
+    'stats': {},
+}
+
+# raw config file, passed on to day mode worker processes
 config = configparser.ConfigParser()
-config.read(os.path.join(os.path.dirname(__file__),"../config.ini"),encoding="UTF-8")
\ No newline at end of file
+# typed values of every SCHEMA option, defaults filled in, e.g. settings['Monitor']['get_interval'] -> int
+settings = {}
+
+def parse_value(kind, value):
+    # raises ValueError when {value} does not fit {kind}
+    if isinstance(kind, tuple):
+        if value not in kind:
+            raise ValueError(f"should be one of {', '.join(kind)}")
+        return value
+    if kind is bool:
+        if value not in ('True', 'False'):
+            raise ValueError("should be True or False")
+        return value == 'True'
+    if kind is list:
+        if not (value.startswith('[') and value.endswith(']')):
+            raise ValueError("should be a list like [a b]")
+        return value[1:-1].split()
+    if kind is str:
+        return value
+    try:
+        return kind(value)
+    except ValueError:
+        raise ValueError(f"should be {kind.__name__}")
+
+def validate(parser, mode) -> tuple:
+    # returns (typed settings, problems found), the settings are only usable when there are no problems
+    errors = []
+    values = {}
+    for section, options in SCHEMA.items():
+        values[section] = {}
+        for key, (kind, default, low, high) in options.items():
+            value = parser.get(section, key, fallback=None)
+            if value is None:
+                values[section][key] = list(default) if kind is list else default
+                continue
+            try:
+                value = parse_value(kind, value)
+            except ValueError as e:
+                errors.append(f"[{section}] {key} = {value}, {e}")
+                continue
+            if low is not None and value < low:
+                errors.append(f"[{section}] {key} = {value}, should be at least {low}")
+            elif high is not None and value > high:
+                errors.append(f"[{section}] {key} = {value}, should be at most {high}")
+            values[section][key] = value
+    required = dict(REQUIRED.get(mode, {}))
+    monitor = values['Monitor']
+    if mode == 'monitor' and monitor['monitor_key_words']:
+        required['Key_Words'] = ('key_words',)
+    if mode == 'monitor' and monitor['monitor_live_key_words']:
+        required['Live_Key_Words'] = ('live_key_words',)
+    for section, keys in required.items():
+        for key in keys:
+            if not parser.get(section, key, fallback=''):
+                errors.append(f"[{section}] {key} is missing")
+    if not errors and monitor['max_poll_interval'] < monitor['min_poll_interval']:
+        errors.append(f"[Monitor] max_poll_interval = {monitor['max_poll_interval']}, "
+                      f"should be at least min_poll_interval = {monitor['min_poll_interval']}")
+    return values, errors
+
+def apply_config(overrides=None):
+    # overrides are {section: {key: value}} strings on top of what was read, settings are rebuilt from both
+    if overrides:
+        config.read_dict(overrides)
+    values, errors = validate(config, config.get('Mode', 'mode', fallback='monitor'))
+    if errors:
+        raise ValueError("配置文件有误：\n" + "\n".join(errors))
+    settings.clear()
+    settings.update(values)
+    return settings
+
+# defaults until a config file is loaded
+settings.update(validate(config, None)[0])
+
+def load_config(path=None, overrides=None):
+    # read once at startup, overrides come from the command line
+    path = path or CONFIG_FILE
+    if not config.read(path, encoding="UTF-8"):
+        raise ValueError(f"找不到配置文件 {os.path.abspath(path)}，请参考 config_sample.ini")
+    return apply_config(overrides)
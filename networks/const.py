@@ -1,4 +1,5 @@
 class TreeHoleURLs(object):
+    Base = "https://treehole.pku.edu.cn"
     Login = "https://treehole.pku.edu.cn/api/login"
     XSRF = "https://treehole.pku.edu.cn/version"
     Verification = "https://treehole.pku.edu.cn/web/verification"
@@ -6,5 +7,11 @@ class TreeHoleURLs(object):
     Verify_msg = "https://treehole.pku.edu.cn/api/jwt_msg_verify"
     Api_content = "https://treehole.pku.edu.cn/api/pku_hole"
     Api_comments = "https://treehole.pku.edu.cn/api/pku_comment_v3"
-    
-    
\ No newline at end of file
+
+    @classmethod
+    def set_base(cls, base):
+        # point every endpoint at another host, e.g. the mock server in benchmarks
+        base = base.rstrip('/')
+        for name in ('Login', 'XSRF', 'Verification', 'Query_msg', 'Verify_msg', 'Api_content', 'Api_comments'):
+            setattr(cls, name, base + getattr(cls, name)[len(cls.Base):])
+        cls.Base = base
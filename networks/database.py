@@ -1,20 +1,74 @@
-from .config import config
+from .config import settings
+import csv
 import os
-import pandas as pd 
+import re
 import sqlite3
 
+from .metrics import metrics
+
+HOLES_COLUMNS = ('text', 'type', 'time', 'reply', 'likenum', 'last_retrive')
+HOLES_UPSERT = '''INSERT INTO holes (pid, text, type, time, reply, likenum, last_retrive)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(pid) DO UPDATE SET
+                        text=excluded.text, type=excluded.type, time=excluded.time, reply=excluded.reply,
+                        likenum=excluded.likenum, last_retrive=excluded.last_retrive'''
+# comments never change once posted, keep the first retrived copy
+COMMENTS_INSERT = '''INSERT INTO comments (cid, pid, text, name, time, comment_id, last_retrive)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(cid) DO NOTHING'''
+HISTORY_INSERT = '''INSERT INTO hole_history (pid, time, reply, likenum, d_reply, d_likenum)
+                        VALUES (?, ?, ?, ?, ?, ?)'''
+
+# the FTS tables index overlapping 2-character tokens, so 2-character Chinese words are found through the
+# index without word segmentation; the tokens are written from Python by index_pending(), the triggers are
+# plain SQL so any other client (sqlite3 shell, notebooks, pandas) can still write the tables
+FTS_TOKENIZER = 'unicode61'
+_FTS_RUNS = re.compile(r'[^\W_]+')
+
+def fts_bigrams(text) -> str:
+    # "期末考试 Exam" -> "期末 末考 考试 ex xa am", a 1-character run is kept as it is
+    tokens = []
+    for run in _FTS_RUNS.findall((text or '').lower()):
+        tokens.extend(run[i:i+2] for i in range(max(1, len(run) - 1)))
+    return ' '.join(tokens)
+
+def index_pending(conn, table_name, key):
+    # apply the changes the triggers queued in {table_name}_fts_queue, run inside the writing transaction
+    # a queued row leaves the index with the text it was indexed with (old, NULL if it never was)
+    # and enters it again with its current text, unless it was deleted
+    rows = conn.execute(f"SELECT q.id, q.old, t.text FROM {table_name}_fts_queue q "
+                        f"LEFT JOIN {table_name} t ON t.{key} = q.id").fetchall()
+    if not rows:
+        return
+    conn.executemany(f"INSERT INTO {table_name}_fts({table_name}_fts, rowid, tokens) VALUES ('delete', ?, ?)",
+                     [(rowid, fts_bigrams(old)) for rowid, old, _ in rows if old is not None])
+    conn.executemany(f"INSERT INTO {table_name}_fts(rowid, tokens) VALUES (?, ?)",
+                     [(rowid, fts_bigrams(text)) for rowid, _, text in rows if text is not None])
+    conn.execute(f"DELETE FROM {table_name}_fts_queue")
+
 class SQLDatabase(object):
-    def __init__(self, database_name):
+    def __init__(self, database_name, remove_exisited=None):
         self.database_name = database_name
-        self.remove_exisited = config['Defaults']['remove_exisited'] == 'True'
+        if remove_exisited is None:
+            remove_exisited = settings['Defaults']['remove_exisited']
+        self.remove_exisited = remove_exisited
         if self.remove_exisited and os.path.exists(database_name):
-            os.remove(database_name)
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(database_name + suffix):
+                    os.remove(database_name + suffix)
+        # one long-lived connection, WAL lets readers run while we write
+        self.conn = sqlite3.connect(database_name, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.c = self.conn.cursor()
+        self.fts = True
+
+    def close(self):
+        self.conn.close()
 
     def create_holes_table(self):
-        with sqlite3.connect(self.database_name) as conn:
-            self.conn = sqlite3.connect(self.database_name)
-            self.c = self.conn.cursor()
-            self.c.execute(f'''CREATE TABLE IF NOT EXISTS holes
+        with self.conn:
+            self.conn.execute(f'''CREATE TABLE IF NOT EXISTS holes
                         (pid INTEGER PRIMARY KEY,
                         text TEXT,
                         type TEXT,
@@ -22,64 +76,71 @@ class SQLDatabase(object):
                         reply INTEGER,
                         likenum INTEGER,
                         last_retrive TEXT)''')
-            self.conn.commit()
-    
-    def update_holes_data(self, data:pd.DataFrame):
-        with sqlite3.connect(self.database_name) as conn:
-            c = conn.cursor()
-            for index, row in data.iterrows():
-                pid = index
-                text = row['text']
-                dtype = row['type']
-                time = str(row['time'])
-                reply = row['reply']
-                likenum = row['likenum']
-                last_retrive = row['last_retrive']
-                c.execute("SELECT * FROM holes WHERE pid=?", (pid,))
-                result = c.fetchone()
-                if result:
-                    c.execute("UPDATE holes SET text=?, type=?, time=?, reply=?, likenum=?, last_retrive=? WHERE pid=?", (text, dtype, time, reply, likenum, last_retrive, pid))
-                else:
-                    c.execute("INSERT INTO holes (pid, text, type, time, reply, likenum, last_retrive) VALUES (?, ?, ?, ?, ?, ?, ?)", (pid, text, dtype, time, reply, likenum, last_retrive))
-            conn.commit()
-
-    def export_to_csv(self, table_name, filename):
-        with sqlite3.connect(self.database_name) as conn:
-            df = pd.read_sql_query(f"SELECT * from {table_name}", conn)
-            df.to_csv(filename, index=True)
-    
-    def get_holes_data(self, pid:int):
-        with sqlite3.connect(self.database_name) as conn:
-            df = pd.read_sql_query(f"SELECT * from holes WHERE pid={pid}", conn)
-            return df
-        
-    def get_comments_data(self, pid:int):
-        with sqlite3.connect(self.database_name) as conn:
-            df = pd.read_sql_query(f"SELECT * from comments WHERE pid={pid}", conn)
-            return df
-        
+            self.conn.execute("CREATE INDEX IF NOT EXISTS holes_time ON holes(time)")
+        self.create_fts_table('holes', 'pid')
+
+    def update_holes_data(self, data):
+        self.upsert_holes(data.loc[:, list(HOLES_COLUMNS)].astype({'time': str}).itertuples(name=None))
+
+    def upsert_holes(self, rows):
+        # rows: (pid, text, type, time, reply, likenum, last_retrive) tuples
+        rows = list(rows)
+        if not rows:
+            return
+        metrics.inc('db_rows_total', len(rows), table='holes')
+        with metrics.timer('db_write_seconds', table='holes'), self.conn:
+            self.conn.executemany(HOLES_UPSERT, rows)
+            if self.fts:
+                index_pending(self.conn, 'holes', 'pid')
+
+    def export_to_csv(self, table_name, filename, chunk_rows=10000):
+        # streamed in chunks, same layout as DataFrame.to_csv with the default index
+        cur = self.conn.execute(f"SELECT * from {table_name}")
+        with open(filename, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow([''] + [d[0] for d in cur.description])
+            index = 0
+            while True:
+                rows = cur.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                writer.writerows((index + i,) + row for i, row in enumerate(rows))
+                index += len(rows)
+
+    def get_hole_text(self, pid:int):
+        row = self.conn.execute("SELECT text FROM holes WHERE pid=?", (int(pid),)).fetchone()
+        return None if row is None else row[0]
+
+    def get_comments_rows(self, pid:int) -> list:
+        # (cid, name, text) of a hole, oldest first
+        return self.conn.execute("SELECT cid, name, text FROM comments WHERE pid=? ORDER BY cid", (int(pid),)).fetchall()
+
+    def get_max_cids(self) -> dict:
+        # highest stored cid for every pid, used to resume delta comment fetching
+        return dict(self.conn.execute("SELECT pid, MAX(cid) FROM comments GROUP BY pid"))
+
     def get_statistics(self, table_name:str): # holes or pages
-        with sqlite3.connect(self.database_name) as conn:
-            c = conn.cursor()
-            c.execute(f"SELECT COUNT(*) FROM {table_name}")
-            total_rows = c.fetchone()[0]
-            c.execute(f"SELECT time FROM {table_name} ORDER BY pid DESC LIMIT 1")
-            latest_time = c.fetchone()[0]
-            c.execute(f"SELECT time FROM {table_name} ORDER BY pid LIMIT 1")
-            oldest_time = c.fetchone()[0]
-            c.execute(f"SELECT last_retrive FROM {table_name} ORDER BY pid DESC LIMIT 1")
-            last_update_time = c.fetchone()[0]
-            
-            print(f"Total number of holes: {total_rows}")
-            print(f"From time: {oldest_time}")
-            print(f"To time: {latest_time}")
-            print(f"Last Update: {last_update_time}")
+        c = self.conn.cursor()
+        c.execute(f"SELECT COUNT(*) FROM {table_name}")
+        total_rows = c.fetchone()[0]
+        if total_rows == 0:
+            print(f"Total number of {table_name}: 0")
+            return
+        c.execute(f"SELECT time FROM {table_name} ORDER BY pid DESC LIMIT 1")
+        latest_time = c.fetchone()[0]
+        c.execute(f"SELECT time FROM {table_name} ORDER BY pid LIMIT 1")
+        oldest_time = c.fetchone()[0]
+        c.execute(f"SELECT last_retrive FROM {table_name} ORDER BY pid DESC LIMIT 1")
+        last_update_time = c.fetchone()[0]
+
+        print(f"Total number of holes: {total_rows}")
+        print(f"From time: {oldest_time}")
+        print(f"To time: {latest_time}")
+        print(f"Last Update: {last_update_time}")
 
     def create_comments_table(self):
-        with sqlite3.connect(self.database_name) as conn:
-            self.conn = sqlite3.connect(self.database_name)
-            self.c = self.conn.cursor()
-            self.c.execute(f'''CREATE TABLE IF NOT EXISTS comments
+        with self.conn:
+            self.conn.execute(f'''CREATE TABLE IF NOT EXISTS comments
                         (cid INTEGER PRIMARY KEY,
                         pid INTEGER,
                         text TEXT,
@@ -87,26 +148,98 @@ class SQLDatabase(object):
                         time TEXT,
                         comment_id TEXT,
                         last_retrive TEXT)''')
-            self.conn.commit()
-
-    def update_comments_data(self, data:pd.DataFrame):
-        with sqlite3.connect(self.database_name) as conn:
-            c = conn.cursor()
-            for index, row in data.iterrows():
-                try:
-                    cid = index
-                    pid = row['pid']
-                    text = row['text']
-                    name = row['name']
-                    time = str(row['time'])
-                    comment_id = row['comment_id']
-                    last_retrive = row['last_retrive']
-                    c.execute("SELECT * FROM comments WHERE cid=?", (cid,))
-                    result = c.fetchone()
-                except:
-                    print("Error!")
-                    print(index, row)
-                if not result:
-                    c.execute("INSERT INTO comments (cid, pid, text, name, time, comment_id, last_retrive) VALUES (?, ?, ?, ?, ?, ?, ?)", (cid, pid, text, name, time, comment_id, last_retrive))
-
-            conn.commit()
+            self.conn.execute("CREATE INDEX IF NOT EXISTS comments_pid ON comments(pid)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS comments_time ON comments(time)")
+        self.create_fts_table('comments', 'cid')
+
+    def create_history_table(self):
+        # append-only reply/like time series, one row whenever a hole's counts change
+        with self.conn:
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS hole_history
+                        (pid INTEGER,
+                        time TEXT,
+                        reply INTEGER,
+                        likenum INTEGER,
+                        d_reply INTEGER,
+                        d_likenum INTEGER)''')
+            self.conn.execute("CREATE INDEX IF NOT EXISTS hole_history_pid ON hole_history(pid, time)")
+
+    def create_fts_table(self, table_name, key):
+        # contentless FTS5 index of fts_bigrams({table_name}.text), the triggers only queue the rows that
+        # changed and index_pending() indexes them, so clients without fts_bigrams can write the table
+        # trigram indexes of older versions are rebuilt, triggers calling fts_bigrams in SQL are replaced
+        row = self.conn.execute("SELECT sql FROM sqlite_master WHERE name=?", (f"{table_name}_fts",)).fetchone()
+        rebuild = row is None or 'trigram' in row[0]
+        try:
+            with self.conn:
+                if rebuild:
+                    self.conn.execute(f"DROP TABLE IF EXISTS {table_name}_fts")
+                    self.conn.execute(f"DROP TABLE IF EXISTS {table_name}_fts_queue")
+                for trigger in ('insert', 'delete', 'update'):
+                    sql = self.conn.execute("SELECT sql FROM sqlite_master WHERE name=?",
+                                            (f"{table_name}_fts_{trigger}",)).fetchone()
+                    if sql is not None and (rebuild or 'fts_bigrams' in sql[0]):
+                        self.conn.execute(f"DROP TRIGGER {table_name}_fts_{trigger}")
+                self.conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {table_name}_fts "
+                                  f"USING fts5(tokens, content='', tokenize='{FTS_TOKENIZER}')")
+                # id -> text it is indexed with, NULL while it is not indexed; the first queued old text is kept
+                self.conn.execute(f"CREATE TABLE IF NOT EXISTS {table_name}_fts_queue (id INTEGER PRIMARY KEY, old TEXT)")
+                self.conn.execute(f"""CREATE TRIGGER IF NOT EXISTS {table_name}_fts_insert AFTER INSERT ON {table_name} BEGIN
+                            INSERT OR IGNORE INTO {table_name}_fts_queue VALUES (new.{key}, NULL); END""")
+                self.conn.execute(f"""CREATE TRIGGER IF NOT EXISTS {table_name}_fts_delete AFTER DELETE ON {table_name} BEGIN
+                            INSERT OR IGNORE INTO {table_name}_fts_queue VALUES (old.{key}, COALESCE(old.text, '')); END""")
+                self.conn.execute(f"""CREATE TRIGGER IF NOT EXISTS {table_name}_fts_update AFTER UPDATE OF text ON {table_name}
+                            WHEN old.text IS NOT new.text BEGIN
+                            INSERT OR IGNORE INTO {table_name}_fts_queue VALUES (old.{key}, COALESCE(old.text, '')); END""")
+                if rebuild: # index rows crawled before the FTS table existed
+                    self.conn.execute(f"INSERT INTO {table_name}_fts_queue SELECT {key}, NULL FROM {table_name}")
+                # and rows other clients wrote since the last run
+                index_pending(self.conn, table_name, key)
+        except sqlite3.OperationalError as e:
+            print(f"全文索引不可用({e})，搜索将退化为逐行扫描")
+            self.fts = False
+
+    def search(self, key_words:list, table_name:str='holes', start:str=None, end:str=None, limit:int=50) -> list:
+        # every key word has to appear, time range compares the 'YYYY-mm-dd HH:MM:SS' strings
+        # key words of 2+ characters are looked up as a phrase of their bigrams, LIKE then checks the exact
+        # text of the matched rows; 1-character words only have LIKE
+        columns = 'pid, time, reply, likenum, text' if table_name == 'holes' else 'cid, pid, time, name, text'
+        key = 'pid' if table_name == 'holes' else 'cid'
+        fts = self.fts and self.conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name IN (?, ?)",
+                                             (f"{table_name}_fts", f"{table_name}_fts_queue")).fetchone()[0] == 2
+        phrases = []
+        for w in key_words:
+            tokens = fts_bigrams(w).split()
+            if fts and tokens and all(len(t) >= 2 for t in tokens):
+                phrases.append('"' + ' '.join(tokens) + '"')
+        where, params = [], []
+        if phrases: # rows still queued for index_pending() are left to LIKE
+            where.append(f"({key} IN (SELECT rowid FROM {table_name}_fts WHERE {table_name}_fts MATCH ?) "
+                         f"OR {key} IN (SELECT id FROM {table_name}_fts_queue))")
+            params.append(' AND '.join(phrases))
+        for w in key_words:
+            where.append("text LIKE ? ESCAPE '\\'")
+            params.append('%' + w.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        if start:
+            where.append("time >= ?")
+            params.append(start)
+        if end:
+            where.append("time <= ?")
+            params.append(end)
+        sql = f"SELECT {columns} FROM {table_name}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {key} DESC LIMIT ?"
+        params.append(limit)
+        return self.conn.execute(sql, params).fetchall()
+
+    def insert_comments(self, rows):
+        # rows: (cid, pid, text, name, time, comment_id, last_retrive) tuples
+        rows = list(rows)
+        if not rows:
+            return
+        metrics.inc('db_rows_total', len(rows), table='comments')
+        with metrics.timer('db_write_seconds', table='comments'), self.conn:
+            self.conn.executemany(COMMENTS_INSERT, rows)
+            if self.fts:
+                index_pending(self.conn, 'comments', 'cid')
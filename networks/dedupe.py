@@ -0,0 +1,51 @@
+import sqlite3
+import time
+from collections import OrderedDict
+
+class PostedStore(object):
+    # pids already notified, in memory for O(1) lookups and in a small sqlite table so restarts don't re-notify
+    # entries expire after {ttl} seconds and at most {max_size} are kept, oldest go first
+    def __init__(self, database_name, ttl=7*24*60*60, max_size=100000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.posted = OrderedDict() # pid -> posted time, oldest first
+        self.conn = sqlite3.connect(database_name, check_same_thread=False)
+        with self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS posted (pid INTEGER PRIMARY KEY, time REAL)")
+        self.expire()
+        rows = self.conn.execute("SELECT pid, time FROM (SELECT pid, time FROM posted ORDER BY time DESC LIMIT ?) "
+                                 "ORDER BY time", (max_size,))
+        self.posted.update(rows)
+
+    def __len__(self):
+        return len(self.posted)
+
+    def __contains__(self, pid):
+        posted_at = self.posted.get(pid)
+        return posted_at is not None and posted_at >= time.time() - self.ttl
+
+    def add(self, pids):
+        now = time.time()
+        rows = []
+        for pid in pids:
+            pid = int(pid)
+            self.posted.pop(pid, None)
+            self.posted[pid] = now
+            rows.append((pid, now))
+        if not rows:
+            return
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO posted (pid, time) VALUES (?, ?)", rows)
+        self.expire(now)
+
+    def expire(self, now=None):
+        cutoff = (time.time() if now is None else now) - self.ttl
+        evicted = []
+        while self.posted and (len(self.posted) > self.max_size or next(iter(self.posted.values())) < cutoff):
+            evicted.append((self.posted.popitem(last=False)[0],))
+        with self.conn:
+            self.conn.execute("DELETE FROM posted WHERE time < ?", (cutoff,))
+            self.conn.executemany("DELETE FROM posted WHERE pid = ?", evicted)
+
+    def close(self):
+        self.conn.close()
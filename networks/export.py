@@ -0,0 +1,116 @@
+import csv
+import importlib.util
+import json
+import os
+import time
+from itertools import groupby
+
+from .archive import Archive, data_dir
+from .config import settings
+
+EXPORT_COLUMNS = {
+    'holes': (('pid', 'int64'), ('text', 'string'), ('type', 'string'), ('time', 'string'), ('reply', 'int64'),
+              ('likenum', 'int64'), ('last_retrive', 'string'), ('archived', 'int64')),
+    'comments': (('cid', 'int64'), ('pid', 'int64'), ('text', 'string'), ('name', 'string'), ('time', 'string'),
+                 ('comment_id', 'string'), ('last_retrive', 'string'), ('archived', 'int64')),
+}
+
+class CSVPartition(object):
+    extension = 'csv'
+
+    def __init__(self, path, columns, compression=None):
+        self.f = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.f)
+        self.writer.writerow([name for name, _ in columns])
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.f.close()
+
+class ParquetPartition(object):
+    extension = 'parquet'
+
+    def __init__(self, path, columns, compression='zstd'):
+        import pyarrow as pa # optional, only needed for format = parquet
+        import pyarrow.parquet as pq
+        self.pa = pa
+        self.schema = pa.schema([(name, getattr(pa, dtype)()) for name, dtype in columns])
+        self.writer = pq.ParquetWriter(path, self.schema, compression=compression)
+
+    def write(self, rows):
+        pa = self.pa
+        arrays = [pa.array([row[i] for row in rows], type=field.type) for i, field in enumerate(self.schema)]
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+def export_table(archive, table_name, out_dir, since, until, partition=CSVPartition, chunk_rows=50000,
+                 compression='zstd') -> int:
+    # rows archived in runs (since, until], one file per day of posting: {out_dir}/{table}/day={date}/part-{until}
+    # rows are streamed in chunks of {chunk_rows} ordered by time, so one partition is open at a time
+    columns = EXPORT_COLUMNS[table_name]
+    names = [name for name, _ in columns]
+    time_index = names.index('time')
+    cur = archive.conn.execute(f"SELECT {', '.join(names)} FROM {table_name} "
+                               "WHERE archived > ? AND archived <= ? ORDER BY time", (since, until))
+    day, writer, total = None, None, 0
+    try:
+        while True:
+            rows = cur.fetchmany(chunk_rows)
+            if not rows:
+                break
+            total += len(rows)
+            for row_day, group in groupby(rows, key=lambda row: row[time_index][:10]):
+                if row_day != day:
+                    if writer is not None:
+                        writer.close()
+                    day = row_day
+                    folder = os.path.join(out_dir, table_name, f"day={day}")
+                    os.makedirs(folder, exist_ok=True)
+                    writer = partition(os.path.join(folder, f"part-{until:06d}.{partition.extension}"),
+                                       columns, compression)
+                writer.write(list(group))
+    finally:
+        if writer is not None:
+            writer.close()
+    return total
+
+def export_treehole():
+    # merge the day databases into the archive, then export what was archived since the last export
+    options = settings['Export']
+    fmt = options['format']
+    out_dir = options['out_dir'] or os.path.join(data_dir(), "export")
+    chunk_rows = options['chunk_rows']
+    compression = options['compression']
+    partition = CSVPartition
+    if fmt == 'parquet':
+        if importlib.util.find_spec('pyarrow') is None:
+            print("未安装 pyarrow，改为导出 csv")
+        else:
+            partition = ParquetPartition
+
+    begin = time.perf_counter()
+    archive = Archive()
+    copied = archive.update()
+    print(f"归档完成：holes {copied['holes']} 条，comments {copied['comments']} 条")
+    os.makedirs(out_dir, exist_ok=True)
+    watermark_file = os.path.join(out_dir, "_watermark.json")
+    watermark = {}
+    if os.path.exists(watermark_file):
+        with open(watermark_file) as f:
+            watermark = json.load(f)
+    until = archive.last_run()
+    for table_name in ('holes', 'comments'):
+        since = watermark.get(table_name, 0)
+        rows = export_table(archive, table_name, out_dir, since, until, partition, chunk_rows, compression)
+        watermark[table_name] = until
+        tmp = watermark_file + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(watermark, f)
+        os.replace(tmp, watermark_file)
+        print(f"导出 {table_name} {rows} 条至 {os.path.join(out_dir, table_name)}")
+    archive.close()
+    print(f"用时 {time.perf_counter() - begin:.1f} s")
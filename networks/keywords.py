@@ -0,0 +1,65 @@
+import re
+
+class KeywordMatcher(object):
+    # all keywords compiled into one alternation, each text is scanned once in C
+    def __init__(self, words):
+        self.words = list(dict.fromkeys(w for w in words if w))
+        alternation = '|'.join(re.escape(w) for w in sorted(self.words, key=len, reverse=True))
+        self._any = re.compile(alternation) if self.words else None
+        # zero-width lookahead reports the longest keyword starting at every position
+        self._all = re.compile(f"(?=({alternation}))") if self.words else None
+        # a keyword found at a position implies every keyword it contains
+        self._implied = {w: {k for k in self.words if k in w} for w in self.words}
+
+    def search(self, text:str) -> bool:
+        return self._any is not None and self._any.search(text) is not None
+
+    def find(self, text:str) -> set:
+        found = set()
+        if self._all is not None:
+            for word in set(self._all.findall(text)):
+                found |= self._implied[word]
+        return found
+
+class KeywordMonitor(object):
+    # [Key_Words] and [Live_Key_Words] matchers plus the live match state of every tracked pid
+    def __init__(self, key_words=None, kw_parse='list', live_key_words=(), negative_live_key_words=()):
+        if key_words is None:
+            self._key_word_match = lambda text: False
+        elif kw_parse == 'list':
+            # intersection, every key word has to show up
+            matcher = KeywordMatcher(key_words)
+            required = set(matcher.words)
+            self._key_word_match = lambda text: matcher.find(text) >= required
+        else:
+            pattern = re.compile(key_words, flags=re.DOTALL)
+            self._key_word_match = lambda text: pattern.match(text) is not None
+        self.live = KeywordMatcher(live_key_words)
+        self.negative = KeywordMatcher(negative_live_key_words)
+        self.live_state = {} # pid -> [positive hit, negative hit]
+
+    def match_key_words(self, text:str) -> bool:
+        return self._key_word_match(text)
+
+    def feed(self, pid, texts):
+        # post text or newly arrived comments, each text is matched exactly once
+        state = self.live_state.setdefault(pid, [False, False])
+        for text in texts:
+            if not state[0] and self.live.search(text):
+                state[0] = True
+            if not state[1] and self.negative.search(text):
+                state[1] = True
+
+    def is_live_match(self, pid) -> bool:
+        state = self.live_state.get(pid)
+        return state is not None and state[0] and not state[1]
+
+    def state(self) -> list:
+        return [[pid, pos, neg] for pid, (pos, neg) in self.live_state.items()]
+
+    def restore(self, state):
+        for pid, pos, neg in state:
+            self.live_state[pid] = [pos, neg]
+
+    def forget(self, pid):
+        self.live_state.pop(pid, None)
@@ -1,112 +1,349 @@
+import multiprocessing
 import os
+import queue
 import random
-import re
 import time
+from concurrent.futures import ThreadPoolExecutor, wait, ALL_COMPLETED, FIRST_COMPLETED
 from datetime import datetime
-from collections import defaultdict, OrderedDict
+from collections import deque
 
-import pandas as pd
-import requests
-
-from .config import config
+from .config import config, settings, apply_config
 from .const import TreeHoleURLs
+from .archive import data_dir
+from .changes import ChangeDetector
+from .checkpoint import Checkpoint
 from .database import SQLDatabase
-from .utils import TreeHoleClient, HotHoles, print_time
+from .dedupe import PostedStore
+from .keywords import KeywordMonitor
+from .metrics import metrics, MetricsExporter
+from .notify import Notifier
+from .parse import hole_rows
+from .scheduler import PollScheduler
+from .tracker import HoleTracker
+from .writer import DBWriter
+from .utils import TreeHoleClient, HotHoles, HoleDeleted, RateLimiter, print_time
+
+# day mode fetches a failed comment thread this many more times before it gives up on the crawl
+COMMENT_RETRIES = 2
 
 class Crawler(object):
-    def __init__(self):
+    def __init__(self, shard=None, database_name=None, init_time=None):
+        # shard: (index, count) of a day mode worker process, which crawls pages index+1, index+1+count, ...
         self.init_date = str(datetime.now()).split()[0]
-        self.init_time = datetime.now()
+        self.init_time = init_time or datetime.now()
+        self.shard = shard
         self.login_status = False
-        self.mode = config['Mode']['mode']
-        self.num_days = int(config['Day']['num_days'])
-        self.search_pages = int(config['Monitor']['search_pages'])
-        self.page_interval = int(config['Defaults']['page_interval'])
-        self.get_interval = int(config['Monitor']['get_interval'])
-        self.morning_sleep = config['Monitor']['morning_sleep'] == 'True'
-        self.monitor_key_words = config['Monitor']['monitor_key_words'] == 'True'
-        self.monitor_live_key_words = config['Monitor']['monitor_live_key_words'] == 'True'
-        self.with_comments = config['Defaults']['comments'] == 'True'
-        self.max_hole_actions = int(config['Monitor']['max_hole_actions'])
-        self.show_hot = config['Monitor']['show_hot'] == 'True'
-        self.show_hot_num = int(config['Monitor']['show_hot_num'])
-        self.show_hot_time = int(config['Monitor']['show_hot_time'])
+        defaults, monitor = settings['Defaults'], settings['Monitor']
+        self.mode = settings['Mode']['mode']
+        self.num_days = settings['Day']['num_days']
+        self.prefetch_pages = settings['Day']['prefetch_pages']
+        self.day_workers = settings['Day']['day_workers']
+        self.search_pages = monitor['search_pages']
+        self.page_interval = defaults['page_interval']
+        self.get_interval = monitor['get_interval']
+        self.morning_sleep = monitor['morning_sleep']
+        self.monitor_key_words = monitor['monitor_key_words']
+        self.monitor_live_key_words = monitor['monitor_live_key_words']
+        self.with_comments = defaults['comments']
+        self.max_hole_actions = monitor['max_hole_actions']
+        self.show_hot = monitor['show_hot']
+        self.show_hot_num = monitor['show_hot_num']
+        self.show_hot_time = monitor['show_hot_time']
+        self.min_poll_interval = monitor['min_poll_interval']
+        self.max_poll_interval = monitor['max_poll_interval']
+        self.request_budget = monitor['request_budget']
         
         self.show_hot_task_executed = False
         self.hot_pid_list = []
         self.hotness_threshold = 0
         self.info_pid_set = set()
-        self.hot_holes = HotHoles()
-        self.monitoring_dict = defaultdict(int) # comments count
-        self.monitoring_dict_iter = defaultdict(int) # iteration count
-        self.monitoring_df = pd.DataFrame()
+        self.hot_holes = HotHoles(self.show_hot_num)
+        self.tracker = HoleTracker()
+        # comment refreshes follow each hole's velocity, page scans run every get_interval minutes
+        self.scheduler = PollScheduler(self.min_poll_interval, self.max_poll_interval, self.request_budget,
+                                       self.max_hole_actions)
+        self.next_page_scan = 0
 
         if self.mode == 'monitor' and self.monitor_key_words: 
             self.monitor_key_word_init()
         if self.mode == 'monitor' and self.monitor_live_key_words:
             self.monitor_live_key_word_init()
+        # compiled once, every post and comment is matched when it arrives
+        self.keywords = KeywordMonitor(getattr(self, 'key_words', None), getattr(self, 'kw_parse', 'list'),
+                                       getattr(self, 'live_key_words', ()), getattr(self, 'negative_live_key_words', ()))
         
         # initialize database and client
         self.client = TreeHoleClient()
-        self.db = SQLDatabase(os.path.join(os.path.dirname(__file__),f"../data/{self.init_date}_holes_{self.mode}.db"))
-        self.db.create_holes_table()
-        self.db.create_comments_table()
-        # self.db.create_comments_table()
+        # day mode spaces page requests by page_interval, worker processes split it and the rate limit
+        shards = 1 if shard is None else shard[1]
+        self.client.rate_limiter.rate /= shards
+        self.page_limiter = RateLimiter(1 / (self.page_interval * shards) if self.page_interval > 0 else 0)
+        self.data_dir = data_dir()
+        # login tokens, monitor state and the day mode page cursor survive restarts
+        self.checkpoint = None
+        self.saved_state = {}
+        self.day_cursor = None
+        if defaults['checkpoint'] and shard is None:
+            self.checkpoint = Checkpoint(os.path.join(self.data_dir, f"checkpoint_{self.mode}.json"),
+                                         defaults['checkpoint_interval'])
+            self.saved_state = self.checkpoint.load()
+        database_name = database_name or os.path.join(self.data_dir, f"{self.init_date}_holes_{self.mode}.db")
+        cursor = self.saved_state.get('day')
+        resume = (self.mode == 'day' and cursor is not None and cursor['database'] == database_name
+                  and cursor['num_days'] == self.num_days)
+        if resume:
+            self.day_cursor = cursor
+            self.day_cursor.setdefault('pages', [cursor.pop('page', 1)])
+            self.init_time = datetime.fromtimestamp(cursor['init_time'])
+        self.with_history = defaults['hole_history']
+        # a resumed crawl keeps the rows stored before the restart, workers write into their parent's database
+        self.open_database(database_name, remove_exisited=False if resume or shard is not None else None)
+        # pids already sent to server chan, kept across days and restarts
+        self.posted = None
+        if self.mode == 'monitor' and self.monitor_key_words:
+            self.posted = PostedStore(os.path.join(self.data_dir, "posted.db"), self.posted_ttl, self.posted_max)
+        # server chan alerts are sent by a background thread, never from the crawl loop
+        self.notifier = None
+        self.notify_live = settings['Notify']['live_key_words']
+        if self.mode == 'monitor' and (self.monitor_key_words or self.monitor_live_key_words):
+            self.notifier = Notifier.from_config(settings['Key_Words']['server_key'], self.data_dir)
+            if self.notifier is not None:
+                self.notifier.start()
+        if self.mode == 'monitor' and self.saved_state.get('monitor'):
+            self.restore_monitor_state(self.saved_state['monitor'])
+        self.metrics_exporter = MetricsExporter.from_config() if shard is None else None
+        if self.metrics_exporter is not None:
+            self.metrics_exporter.start()
         print(f"TreeHoleClient starting at {str(datetime.now()).split('.')[0]} as {self.mode} mode")
     
+    def open_database(self, database_name, remove_exisited=None) -> None:
+        self.db = SQLDatabase(database_name, remove_exisited)
+        self.db.create_holes_table()
+        self.db.create_comments_table()
+        self.client.known_cids.clear()
+        self.client.known_cids.update(self.db.get_max_cids())
+        # skip rows that are already stored unchanged, optionally keep a reply/like time series
+        if self.with_history:
+            self.db.create_history_table()
+        self.changes = ChangeDetector(self.with_history)
+        self.changes.warm(self.db)
+        # crawl loop hands rows to a writer thread instead of committing itself
+        defaults = settings['Defaults']
+        self.writer = DBWriter(self.db, defaults['write_queue'], defaults['write_batch_rows'],
+                               defaults['write_flush_interval'], self.rows_committed)
+
+    def rows_committed(self, holes, comments) -> None:
+        # writer thread, the rows are stored: advance the change detector and the delta comment watermarks
+        self.changes.committed(holes, comments)
+        known_cids = self.client.known_cids
+        for row in comments:
+            if row[0] > known_cids.get(row[1], -1):
+                known_cids[row[1]] = row[0]
+
+    def roll_over_database(self) -> None:
+        # a monitor running past midnight continues in the new day's database
+        # threads of tracked holes are fetched again in full so every day database is complete
+        today = str(datetime.now()).split()[0]
+        if today == self.init_date:
+            return
+        self.writer.close()
+        self.db.close()
+        self.init_date = today
+        self.open_database(os.path.join(self.data_dir, f"{today}_holes_{self.mode}.db"), remove_exisited=False)
+        print(f"{str(datetime.now()).split('.')[0]} 切换至新数据库 {self.db.database_name}")
+
     def monitor_key_word_init(self):
-        self.key_words = config['Key_Words']['key_words']
+        key_words = settings['Key_Words']
+        self.key_words = key_words['key_words']
         if self.key_words.startswith('[') and self.key_words.endswith(']'):
             self.kw_parse = 'list'
             self.key_words = self.key_words[1:-1].split()
         else: self.kw_parse = 'regular'
-        self.server_key = config['Key_Words']['server_key']
-        self.posted_df_pool = pd.DataFrame()
+        self.server_key = key_words['server_key']
+        self.posted_ttl = key_words['posted_ttl']*24*60*60
+        self.posted_max = key_words['posted_max']
 
     def monitor_live_key_word_init(self):
-        self.live_key_words = config['Live_Key_Words']['live_key_words']
-        self.live_key_words = self.live_key_words[1:-1].split()
-        self.negative_live_key_words = config['Live_Key_Words']['negative_live_key_words']
-        self.negative_live_key_words = self.negative_live_key_words[1:-1].split()
+        self.live_key_words = settings['Live_Key_Words']['live_key_words']
+        self.negative_live_key_words = settings['Live_Key_Words']['negative_live_key_words']
     
-    def check_monitoring_df(self) -> None:
-        # for each iteration check the monitoring_df reply count
-        # if the reply count is not growing, delete the post from monitoring_df
-        for pid, row in self.monitoring_df.iterrows():
-            reply_num = int(row['reply'])
-            if reply_num <= self.monitoring_dict[pid]: # no growing
-                self.monitoring_dict_iter[pid] += 1
-                if self.monitoring_dict_iter[pid] == self.max_hole_actions:
-                    # delete no growing post
-                    self.monitoring_df = self.monitoring_df.drop(pid)
-                    del self.monitoring_dict[pid]
-                    del self.monitoring_dict_iter[pid]
-                    if self.show_hot:
-                        hotness = int(row['reply']) * int(row['likenum'])
-                        self.hot_holes.add_hole(pid, hotness)
-            else:
-                self.monitoring_dict_iter[pid] = 0
-                self.monitoring_dict[pid] = reply_num
+    def evict_hole(self, hole) -> None:
+        # the hole went quiet, stop tracking it
+        self.tracker.remove(hole.pid)
+        self.scheduler.remove(hole.pid)
+        if self.monitor_live_key_words:
+            self.print_hole_with_key_words(hole)
+        self.keywords.forget(hole.pid)
+
+    def update_hot_holes(self) -> None:
+        # re-score tracked holes, unchanged scores cost a dict lookup
+        for hole in self.tracker:
+            self.hot_holes.add_hole(hole.pid, hole.reply * hole.likenum, hole.timestamp)
     
-    def print_holes_with_key_words(self) -> None:
-        for pid, row in self.monitoring_df.iterrows():
-            if self.monitoring_dict_iter[pid] == self.max_hole_actions-1: # to be deleted
-                comments_df = self.db.get_comments_data(pid)
-                row_text = row.text
-                comments_df_text = row_text + comments_df.text.to_string() # combine post and comments
-                if any(negative_key_word in comments_df_text for negative_key_word in self.negative_live_key_words):
-                    continue
-                if any(live_key_word in comments_df_text for live_key_word in self.live_key_words):
-                    print("====================================")
-                    print(f"{str(datetime.now()).split('.')[0]} {pid} with keyword")
-                    print(f"{row.text}")
-                    for cid, comment_row in comments_df.iterrows():
-                        print(f"{cid}\t{comment_row['name']}\t{comment_row.text}")
+    def feed_live_key_words(self, holes) -> None:
+        # match newly tracked posts, plus comments stored before they were (re)tracked
+        if any(hole.pid in self.client.known_cids for hole in holes):
+            self.writer.flush()
+        for hole in holes:
+            self.keywords.feed(hole.pid, [hole.text])
+            if hole.pid in self.client.known_cids:
+                self.keywords.feed(hole.pid, [text for _, _, text in self.db.get_comments_rows(hole.pid)])
+
+    def print_hole_with_key_words(self, hole) -> None:
+        pid = hole.pid
+        if self.keywords.is_live_match(pid):
+            self.writer.flush()
+            comments = self.db.get_comments_rows(pid)
+            print("====================================")
+            print(f"{str(datetime.now()).split('.')[0]} {pid} with keyword")
+            print(f"{hole.text}")
+            for cid, name, text in comments:
+                print(f"{cid}\t{name}\t{text}")
+            if self.notifier is not None and self.notify_live:
+                desp = f"pid: {pid}\ntime: {hole.time}\ntext: {hole.text}\n\n"
+                desp += "\n\n".join(f"{cid} {name}: {text}" for cid, name, text in comments)
+                self.notifier.notify(f"Holemonitor: {pid} 命中实时关键词", desp)
     
+    def save_holes(self, rows) -> None:
+        rows, history = self.changes.changed_holes(rows)
+        self.writer.upsert_holes(rows)
+        self.writer.insert_history(history)
+
+    def save_comments(self, rows) -> None:
+        self.writer.insert_comments(self.changes.new_comments(rows))
+
+    def state(self) -> dict:
+        state = {'time': time.time(), 'session': self.client.session_state() or self.saved_state.get('session', {})}
+        if self.mode == 'monitor':
+            state['monitor'] = {
+                'holes': self.tracker.state(),
+                'scheduler': self.scheduler.state(),
+                'next_page_scan': self.next_page_scan,
+                'hot_holes': self.hot_holes.state(),
+                'live_key_words': self.keywords.state(),
+            }
+        elif self.day_cursor is not None:
+            state['day'] = self.day_cursor
+        return state
+
+    def save_checkpoint(self) -> None:
+        if self.checkpoint is not None:
+            self.checkpoint.save(self.state())
+
+    def restore_monitor_state(self, state) -> None:
+        self.tracker.restore(state['holes'])
+        self.scheduler.restore(state['scheduler'])
+        self.next_page_scan = state['next_page_scan']
+        self.hot_holes.restore(state['hot_holes'])
+        self.keywords.restore(state['live_key_words'])
+        now = time.time()
+        for hole in self.tracker:
+            if hole.pid not in self.scheduler:
+                self.scheduler.add(hole, now)
+        print(f"已恢复监控状态，共{len(self.tracker)}个树洞")
+
+    def close(self):
+        # flush pending writes and stop background threads, called on exit or SIGINT
+        self.save_checkpoint()
+        if self.notifier is not None:
+            self.notifier.stop()
+        self.client.close()
+        self.writer.close()
+        if self.posted is not None:
+            self.posted.close()
+        if self.metrics_exporter is not None:
+            self.metrics_exporter.stop()
+        self.db.close()
+
     @print_time
     def login(self):
+        if self.client.restore_session(self.saved_state.get('session', {})):
+            print("使用保存的登录状态")
+            self.login_status = True
+            return
         print("开始登录")
         self.login_status = self.client.login()
+        self.save_checkpoint()
+
+    def scan_pages(self, now) -> list:
+        # newest posts, holes seen for the first time are scheduled for an immediate refresh
+        new_holes = []
+        for page in range(1, self.search_pages+1):
+            time.sleep(max(0, self.page_interval+random.randint(-1,1)))
+            records = self.client.get_tree_hole_records(page)
+            with metrics.timer('stage_seconds', stage='merge'):
+                new_holes += self.tracker.merge(records)
+        for hole in new_holes:
+            self.scheduler.add(hole, now)
+        if self.monitor_live_key_words:
+            with metrics.timer('stage_seconds', stage='keywords'):
+                self.feed_live_key_words(new_holes)
+        if self.show_hot:
+            self.update_hot_holes()
+        return new_holes
+
+    def refresh_comments(self, now) -> None:
+        # poll the holes that are due, within the request budget
+        holes = []
+        for pid in self.scheduler.pop_due(now):
+            hole = self.tracker.get(pid)
+            if hole is None:
+                continue
+            if self.with_comments and hole.reply > 0:
+                holes.append((pid, hole.reply))
+            elif self.scheduler.polled(hole, 0, now): # nothing to fetch, likes may still grow
+                self.evict_hole(hole)
+        for pid, comment_rows, error in self.client.get_comments_batch(holes):
+            hole = self.tracker.get(pid)
+            if error is None:
+                self.save_comments(comment_rows)
+                if self.monitor_live_key_words:
+                    with metrics.timer('stage_seconds', stage='keywords'):
+                        self.keywords.feed(pid, [row.text for row in comment_rows])
+                if self.scheduler.polled(hole, len(comment_rows), time.time()):
+                    self.evict_hole(hole)
+            elif not isinstance(error, HoleDeleted):
+                # not known to be deleted, polled again with backoff until max_hole_actions failures in a row
+                print(f"{str(datetime.now()).split('.')[0]} {pid} 评论获取失败：{error}")
+                if self.scheduler.failed(hole, time.time()):
+                    print(f"{str(datetime.now()).split('.')[0]} {pid} 评论多次获取失败，停止监控")
+                    self.evict_hole(hole)
+            else:
+                print("====================================")
+                print(f"{str(datetime.now()).split('.')[0]} {pid} deleted!")
+                print(f"{hole.text}")
+                self.tracker.remove(pid)
+                self.keywords.forget(pid)
+                # read the deleted post from the database
+                self.writer.flush()
+                for cid, name, text in self.db.get_comments_rows(pid):
+                    print(f"{cid}\t{name}\t{text}")
+
+    def monitor_cycle(self):
+        # one monitor action: scan new pages when due, refresh due comments, match key words, save holes
+        self.roll_over_database()
+        now = time.time()
+        requests = self.client.requests
+        new_holes = []
+        scanned = now >= self.next_page_scan
+        if scanned:
+            self.next_page_scan = now + self.get_interval*60
+            new_holes = self.scan_pages(now)
+        self.refresh_comments(now)
+        self.scheduler.charge(self.client.requests - requests, time.time())
+
+        if self.monitor_key_words and new_holes:
+            print(f"监控关键词 {self.key_words}")
+            with metrics.timer('stage_seconds', stage='keywords'):
+                matched = self.find_key_word_match(new_holes)
+            if matched:
+                print(f"{str(datetime.now()).split('.')[0]} 找到匹配，正在尝试发送")
+                self.send_message_to_wechat(matched)
+            else:
+                print(f"{str(datetime.now()).split('.')[0]} 未找到匹配")
+        if scanned: # replies and likes of tracked holes only change with a page scan
+            self.save_holes(self.tracker.rows())
+        metrics.set('tracked_holes', len(self.tracker))
 
     @print_time
     def monitor_treehole(self):
@@ -122,122 +359,191 @@ class Crawler(object):
                 
             if self.morning_sleep and datetime.fromtimestamp(time.time()).hour == 3:
                 time.sleep(5*60*60) # sleep to 8am 
-            for page in range(1, self.search_pages+1):
-                time.sleep(self.page_interval+random.randint(-1,1))
-                page_df = self.client.get_tree_hole_data(page)
-                if self.monitoring_df.empty:
-                    self.monitoring_df = page_df
-                else:
-                    self.monitoring_df = self.monitoring_df.combine_first(page_df)
- 
-            if self.with_comments:
-                self.check_monitoring_df() # delete no growing post
-                if self.monitor_live_key_words:
-                    self.print_holes_with_key_words()
-                
-                for pid, row in self.monitoring_df.iterrows():
-                    reply_num = int(row['reply'])
-                    if reply_num > 0:
-                        try:
-                            working_comments_df = self.client.get_comments_data(pid, reply_num)                            
-                            self.db.update_comments_data(working_comments_df)
-
-                        except:
-                            print("====================================")
-                            print(f"{str(datetime.now()).split('.')[0]} {pid} deleted!")
-                            print(f"{row.text}")
-                            # read the deleted post from the database
-                            self.monitoring_df = self.monitoring_df.drop(pid)
-                            del self.monitoring_dict[pid]
-                            del self.monitoring_dict_iter[pid]
-                            
-                            deleted_df = self.db.get_comments_data(pid)
-                            if not deleted_df.empty:
-                                for cid, comment_row in deleted_df.iterrows():
-                                    print(f"{cid}\t{comment_row['name']}\t{comment_row.text}")
-                                    
-            if self.monitor_key_words:
-                print(f"监控关键词 {self.key_words}")
-                match_df = self.find_key_word_match_in_dataframe(self.monitoring_df)
-                if not match_df.empty:
-                    print(f"{str(datetime.now()).split('.')[0]} 找到匹配，正在尝试发送")
-                    self.send_message_to_wechat(match_df)
-                else:
-                    print(f"{str(datetime.now()).split('.')[0]} 未找到匹配")
-            self.db.update_holes_data(self.monitoring_df)
-            time.sleep(self.get_interval*60)
+            cycle_start = time.perf_counter()
+            self.monitor_cycle()
+            elapsed = time.perf_counter() - cycle_start
+            metrics.observe('cycle_seconds', elapsed)
+            overrun = elapsed - self.get_interval*60
+            metrics.set('cycle_overrun_seconds', max(0, overrun))
+            if overrun > 0:
+                metrics.inc('cycle_overrun_total')
+            if self.checkpoint is not None and self.checkpoint.due():
+                self.save_checkpoint()
+            # sleep until the next page scan or the next comment refresh the request budget allows
+            next_due = self.scheduler.next_wake(time.time())
+            wake = self.next_page_scan if next_due is None else min(self.next_page_scan, next_due)
+            time.sleep(max(1, min(wake - time.time(), self.get_interval*60)))
     
     @print_time
     def craw_treehole(self):
         print(f"爬取过去{str(self.num_days)}天消息")
-        page = 1
-        working_df = pd.DataFrame()
-        while True:
-            page_df = self.client.get_tree_hole_data(page)
-            working_df = page_df.combine_first(working_df)
-            if page % 10 == 0:
-                print(f"{str(datetime.now()).split('.')[0]} 爬取至page{page}")
-                # working_df['time'] = working_df.timestamp.apply(datetime.fromtimestamp).astype(str)
-                if self.with_comments:
-                    comments_df = pd.DataFrame()
-                    for pid, row in working_df.iterrows():
-                        reply_num = int(row['reply'])
-                        if reply_num > 0:
-                            comments_df = self.client.get_comments_data(pid, reply_num).combine_first(comments_df)
-                    self.db.update_comments_data(comments_df)
-                self.db.update_holes_data(working_df)
-                working_df = pd.DataFrame() 
-            if (self.init_time - datetime.fromtimestamp(page_df.sort_values('timestamp').iloc[0]['timestamp'])).days == self.num_days:
-                    break
-            page += 1
-            time.sleep(self.page_interval+random.randint(-1,1))            
+        pages = [1] if self.day_cursor is None else self.day_cursor['pages']
+        if self.day_cursor is not None:
+            print(f"从page{min(pages)}继续爬取")
+        self.day_cursor = {'database': self.db.database_name, 'num_days': self.num_days,
+                           'init_time': self.init_time.timestamp(), 'pages': pages}
+        if self.day_workers > 1:
+            self.crawl_sharded(pages)
+        else:
+            self.crawl_pages(first_page(pages, 0, 1), 1, lambda page: self.day_progress(0, page))
         print(f"{str(datetime.now()).split('.')[0]}爬取完成！")
+        self.day_cursor = None
+        self.save_checkpoint()
+        self.writer.flush()
         self.db.get_statistics('holes')
         self.db.get_statistics('comments')
 
-    def send_message_to_wechat(self, df:pd.DataFrame):
-        desp = ''
-        it = df.iterrows()
+    def day_progress(self, shard, page) -> None:
+        # pages of the shard before {page} are committed, a restart continues from there
+        if len(self.day_cursor['pages']) != max(self.day_workers, 1):
+            self.day_cursor['pages'] = [min(self.day_cursor['pages'])] * max(self.day_workers, 1)
+        self.day_cursor['pages'][shard] = page
+        self.save_checkpoint()
+
+    def fetch_page(self, page):
+        self.page_limiter.acquire()
+        return page, self.client.get_tree_hole_records(page)
+
+    def crawl_pages(self, page, step=1, progress=None) -> None:
+        # day mode engine: pages page, page+step, ... until a page has no posts of the last num_days
+        # the next {prefetch_pages} pages are requested while one is processed, comment threads are fetched
+        # in the background as their holes come in; every 10 pages the threads in flight are awaited and
+        # committed before progress(next page) records how far the crawl got
+        cutoff = self.init_time.timestamp() - self.num_days*24*60*60
+        submitted = set()
+        inflight = {} # future -> (pid, reply, attempt)
+        done = 0
+        with ThreadPoolExecutor(max(1, self.prefetch_pages), thread_name_prefix='pages') as executor:
+            pages = deque()
+            for _ in range(max(1, self.prefetch_pages)):
+                pages.append(executor.submit(self.fetch_page, page))
+                page += step
+            while pages:
+                current, records = pages.popleft().result()
+                fresh = [r for r in records if r['timestamp'] >= cutoff]
+                # pinned holes and out-of-order posts are older than their page, only a page without
+                # any fresh regular post ends the crawl
+                finished = not any(not r['is_top'] for r in fresh)
+                if finished:
+                    for future in pages:
+                        future.cancel()
+                    pages.clear()
+                else:
+                    pages.append(executor.submit(self.fetch_page, page))
+                    page += step
+                self.save_holes(hole_rows(fresh))
+                if self.with_comments:
+                    for r in fresh:
+                        if r['reply'] > 0 and r['pid'] not in submitted:
+                            submitted.add(r['pid'])
+                            inflight[self.client.submit_comments(r['pid'], r['reply'])] = (r['pid'], r['reply'], 0)
+                    self.save_done_comments(inflight)
+                done += 1
+                if done % 10 == 0 or finished:
+                    print(f"{str(datetime.now()).split('.')[0]} 爬取至page{current}")
+                    self.save_done_comments(inflight, wait_all=True)
+                    if progress is not None:
+                        self.writer.flush()
+                        progress(current + step)
+
+    def save_done_comments(self, inflight, wait_all=False) -> None:
+        # hand finished comment threads of {inflight} to the writer and drop them from it
+        # a failed thread is fetched again up to COMMENT_RETRIES times, then the crawl stops before
+        # progress() moves the checkpoint past its page; deleted holes have no thread to store
+        while inflight:
+            finished, _ = wait(inflight, timeout=None if wait_all else 0,
+                               return_when=ALL_COMPLETED if wait_all else FIRST_COMPLETED)
+            for future in finished:
+                pid, reply, attempt = inflight.pop(future)
+                _, rows, error = future.result()
+                if error is None:
+                    self.save_comments(rows)
+                elif isinstance(error, HoleDeleted):
+                    print(f"{str(datetime.now()).split('.')[0]} {pid} deleted!")
+                elif attempt < COMMENT_RETRIES:
+                    print(f"{str(datetime.now()).split('.')[0]} {pid} 评论获取失败：{error}，重试")
+                    inflight[self.client.submit_comments(pid, reply)] = (pid, reply, attempt + 1)
+                else:
+                    raise RuntimeError(f"{pid} 评论获取失败：{error}，重新运行将从检查点继续")
+            if not wait_all:
+                return
+
+    def crawl_sharded(self, pages) -> None:
+        # page p goes to worker process (p-1) % day_workers, all of them write into this database
+        # workers reuse the login tokens and report their progress for the checkpoint
+        context = multiprocessing.get_context('spawn')
+        progress = context.Queue()
+        sections = {section: dict(config[section]) for section in config.sections()}
+        session = self.client.session_state()
+        workers = []
+        for shard in range(self.day_workers):
+            worker = context.Process(target=crawl_shard, name=f"day-{shard}",
+                                     args=(sections, shard, self.day_workers, first_page(pages, shard, self.day_workers),
+                                           session, self.db.database_name, self.init_time.timestamp(), progress))
+            worker.start()
+            workers.append(worker)
+        while True:
+            try:
+                shard, page = progress.get(timeout=1)
+            except queue.Empty:
+                if not any(worker.is_alive() for worker in workers):
+                    break
+                continue
+            self.day_progress(shard, page)
+        failed = []
+        for shard, worker in enumerate(workers):
+            worker.join()
+            if worker.exitcode != 0:
+                failed.append(f"worker {shard}({worker.exitcode})")
+        if failed:
+            # the crawl is not finished, the checkpoint keeps every shard's page for the next run
+            raise RuntimeError(f"{', '.join(failed)} 异常退出，重新运行将从检查点继续")
+
+    def send_message_to_wechat(self, holes):
         resp = ''
-        for index, i in it:
-            resp += f"pid: {index}\n"
-            resp += f"time: {i.time}\n"
-            resp += f"text: {i.text}\n"
+        for hole in holes:
+            resp += f"pid: {hole.pid}\n"
+            resp += f"time: {hole.time}\n"
+            resp += f"text: {hole.text}\n"
             resp += "\n"
 
-        _send_data = {
-            "title": f"Holemonitor: 找到匹配，共有{len(df)}条记录",
-            "desp": resp
-        }
-        send_resp = requests.post(f"https://sctapi.ftqq.com/{self.server_key}.send", data=_send_data)
-        if send_resp.status_code == 200:
-            print("通知发送成功")
-        else:
-            print("发送失败，检查server Chan接口")
-
-    def find_key_word_match_in_dataframe(self, df:pd.DataFrame):
-        if self.kw_parse == 'list':
-            for string in self.key_words:
-                df = df[df.text.apply(lambda x: string in x)]
-                if len(df)==0: return df
-        elif self.kw_parse == 'regular':
-            df = df[df.text.str.match(self.key_words, flags=re.DOTALL)]
-        df = df[~df.index.isin(self.posted_df_pool.index)]
-        if not df.empty:
-            self.posted_df_pool = pd.concat([self.posted_df_pool, df])
-        return df
+        if self.notifier is None:
+            print("未配置通知接口，跳过发送")
+            return
+        self.notifier.notify(f"Holemonitor: 找到匹配，共有{len(holes)}条记录", resp)
+        print("通知已加入发送队列")
+
+    def find_key_word_match(self, holes) -> list:
+        # newly tracked holes matching [Key_Words] that were not notified before
+        holes = [hole for hole in holes if self.keywords.match_key_words(hole.text) and hole.pid not in self.posted]
+        self.posted.add(hole.pid for hole in holes)
+        return holes
 
     def print_hot_holes(self, current_time):
         print("====================================")
         print(f"当前时间{current_time}，过去24小时热门帖子如下")
-        for pid, hotness in self.hot_holes.holes.items():
-            hole_df = self.db.get_holes_data(pid)
-            comment_df = self.db.get_comments_data(pid)
+        self.writer.flush()
+        for pid, hotness in self.hot_holes.get_holes().items():
             print(f"pid: {pid} hotness: {hotness}")
-            print(hole_df.text)
-            for cid, comment_row in comment_df.iterrows():
-                print(f"{cid}\t{comment_row['name']}\t{comment_row.text}")
+            print(self.db.get_hole_text(pid))
+            for cid, name, text in self.db.get_comments_rows(pid):
+                print(f"{cid}\t{name}\t{text}")
             print("====================================")
 
-        # reset hot_holes
-        self.hot_holes = HotHoles()
\ No newline at end of file
+def first_page(pages, shard, shards) -> int:
+    # first page of the shard at or after its checkpointed page, any page if the worker count changed
+    page = pages[shard] if len(pages) == shards else min(pages)
+    while (page - 1) % shards != shard:
+        page += 1
+    return page
+
+def crawl_shard(sections, shard, shards, page, session, database_name, init_time, progress):
+    # day mode worker process, {sections} is the parent's config
+    apply_config(sections)
+    crawler = Crawler((shard, shards), database_name, datetime.fromtimestamp(init_time))
+    try:
+        if not crawler.client.restore_session(session):
+            raise RuntimeError("登录状态无效")
+        crawler.crawl_pages(page, shards, lambda next_page: progress.put((shard, next_page)))
+    finally:
+        crawler.close()
@@ -0,0 +1,160 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .config import settings
+
+# seconds, fine enough for a fetch and coarse enough for a whole cycle
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+PREFIX = 'holemonitor_'
+
+class Histogram(object):
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Metrics(object):
+    # process wide counters, gauges and latency histograms, keyed by (name, sorted labels)
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, n=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def to_prometheus(self) -> str:
+        def fmt(name, labels, suffix='', extra=()):
+            labels = tuple(labels) + tuple(extra)
+            inner = ','.join(f'{k}="{v}"' for k, v in labels)
+            return f"{PREFIX}{name}{suffix}{{{inner}}}" if inner else f"{PREFIX}{name}{suffix}"
+
+        lines = []
+        with self._lock:
+            for kind, store in (('counter', self.counters), ('gauge', self.gauges)):
+                typed = set()
+                for (name, labels), value in sorted(store.items()):
+                    if name not in typed:
+                        lines.append(f"# TYPE {PREFIX}{name} {kind}")
+                        typed.add(name)
+                    lines.append(f"{fmt(name, labels)} {value}")
+            typed = set()
+            for (name, labels), hist in sorted(self.histograms.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {PREFIX}{name} histogram")
+                    typed.add(name)
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), hist.counts):
+                    cumulative += count
+                    lines.append(f"{fmt(name, labels, '_bucket', [('le', bound)])} {cumulative}")
+                lines.append(f"{fmt(name, labels, '_sum')} {hist.sum}")
+                lines.append(f"{fmt(name, labels, '_count')} {hist.count}")
+        return '\n'.join(lines) + '\n'
+
+    def to_json(self) -> dict:
+        def key(name, labels):
+            return name + ''.join(f"|{k}={v}" for k, v in labels)
+
+        with self._lock:
+            return {
+                'time': str(time.strftime('%Y-%m-%d %H:%M:%S')),
+                'counters': {key(*k): v for k, v in self.counters.items()},
+                'gauges': {key(*k): v for k, v in self.gauges.items()},
+                'histograms': {key(*k): {'count': h.count, 'sum': round(h.sum, 6)} for k, h in self.histograms.items()},
+            }
+
+metrics = Metrics()
+
+class MetricsExporter(object):
+    # writes the Prometheus text file and appends a JSON line every interval, optionally serves /metrics
+    def __init__(self, prometheus_file=None, json_file=None, interval=60, port=0):
+        self.prometheus_file = prometheus_file
+        self.json_file = json_file
+        self.interval = interval
+        self.port = port
+        self._stop = threading.Event()
+        self._thread = None
+        self._server = None
+
+    @classmethod
+    def from_config(cls):
+        options = settings['Metrics']
+        if not options['enabled']:
+            return None
+        return cls(options['prometheus_file'] or None, options['json_file'] or None, options['interval'],
+                   options['port'])
+
+    def export(self):
+        if self.prometheus_file:
+            tmp = self.prometheus_file + '.tmp'
+            with open(tmp, 'w') as f:
+                f.write(metrics.to_prometheus())
+            os.replace(tmp, self.prometheus_file)
+        if self.json_file:
+            with open(self.json_file, 'a') as f:
+                f.write(json.dumps(metrics.to_json(), ensure_ascii=False) + '\n')
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.export()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='metrics', daemon=True)
+        self._thread.start()
+        if self.port:
+            self._server = ThreadingHTTPServer(('0.0.0.0', self.port), MetricsHandler)
+            threading.Thread(target=self._server.serve_forever, name='metrics-http', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+        self.export()
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        body = metrics.to_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
@@ -0,0 +1,157 @@
+import json
+import os
+import queue
+import threading
+import time
+
+import requests
+
+from .config import settings
+from .metrics import metrics
+
+_STOP = None
+
+class Notifier(object):
+    # server chan alerts are queued by the crawl loop and sent by a background thread
+    # alerts arriving within {window} seconds go out as one digest, at most one digest every {min_gap} seconds,
+    # failed sends are retried with exponential backoff and finally appended to {spool_file}
+    def __init__(self, url, window=60, min_gap=60, retries=3, backoff=5, timeout=10, spool_file=None):
+        self.url = url
+        self.window = window
+        self.min_gap = min_gap
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.spool_file = spool_file
+        self.queue = queue.Queue()
+        self.last_sent = 0
+        self._stop = threading.Event()
+        self._session = requests.Session()
+        self._thread = None
+
+    @classmethod
+    def from_config(cls, server_key, data_dir):
+        options = settings['Notify']
+        if not options['enabled']:
+            return None
+        url = options['url'] or (server_key and f"https://sctapi.ftqq.com/{server_key}.send")
+        if not url:
+            return None
+        return cls(url, options['window'], options['min_gap'], options['retries'], options['backoff'],
+                   options['timeout'], os.path.join(data_dir, "notify_spool.jsonl"))
+
+    def notify(self, title:str, desp:str):
+        # never blocks the caller
+        self.queue.put((title, desp))
+        metrics.set('notify_queue_size', self.queue.qsize())
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='notifier', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None and self._thread.is_alive():
+            self._stop.set()
+            self.queue.put(_STOP)
+            self._thread.join(self.timeout + 5)
+
+    def _collect(self):
+        # block for the first alert, then gather whatever arrives within the window
+        alert = self.queue.get()
+        if alert is _STOP:
+            return [], True
+        alerts = [alert]
+        deadline = time.monotonic() + self.window
+        while not self._stop.is_set():
+            try:
+                alert = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if alert is _STOP:
+                return alerts, True
+            alerts.append(alert)
+        stopping = self._stop.is_set()
+        while stopping: # take everything still queued before exiting
+            try:
+                alert = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if alert is not _STOP:
+                alerts.append(alert)
+        return alerts, stopping
+
+    def _digest(self, alerts):
+        if len(alerts) == 1:
+            return alerts[0]
+        return f"Holemonitor: {len(alerts)}条提醒", "\n\n---\n\n".join(desp for _, desp in alerts)
+
+    def _send(self, title, desp, retries) -> bool:
+        attempt = 0
+        while True:
+            try:
+                resp = self._session.post(self.url, data={'title': title, 'desp': desp}, timeout=self.timeout)
+                if resp.status_code == 200:
+                    metrics.inc('notify_sent_total')
+                    return True
+                print(f"发送失败，检查server Chan接口，状态码：{resp.status_code}")
+            except requests.RequestException as e:
+                print(f"发送失败：{e}")
+            metrics.inc('notify_failed_total')
+            if attempt >= retries:
+                return False
+            if self._stop.wait(self.backoff * 2 ** attempt):
+                retries = attempt + 1 # shutting down, one last try
+            attempt += 1
+
+    def _run(self):
+        self._resend_spool()
+        while True:
+            alerts, stopping = self._collect()
+            metrics.set('notify_queue_size', self.queue.qsize())
+            if alerts:
+                if not stopping:
+                    self._stop.wait(max(0, self.last_sent + self.min_gap - time.monotonic()))
+                title, desp = self._digest(alerts)
+                if self._send(title, desp, 0 if stopping else self.retries):
+                    print("通知发送成功")
+                else:
+                    self._spool(alerts)
+                self.last_sent = time.monotonic()
+            if stopping:
+                return
+
+    def _spool(self, alerts):
+        if not self.spool_file:
+            return
+        with open(self.spool_file, 'a', encoding='utf-8') as f:
+            for title, desp in alerts:
+                f.write(json.dumps({'time': time.time(), 'title': title, 'desp': desp}, ensure_ascii=False) + '\n')
+        metrics.inc('notify_spooled_total', len(alerts))
+        print(f"{len(alerts)}条提醒未送达，已保存至{self.spool_file}")
+
+    def _resend_spool(self):
+        # alerts left over from an earlier run go out first as one digest
+        # the spool file is removed only once they are delivered, until then a crash cannot lose them
+        alerts = self._load_spool()
+        if not alerts:
+            return
+        if self._send(*self._digest(alerts), self.retries):
+            print(f"{len(alerts)}条未送达的提醒已补发")
+            os.remove(self.spool_file)
+        else:
+            print(f"{len(alerts)}条未送达的提醒补发失败，仍保存在{self.spool_file}")
+        self.last_sent = time.monotonic()
+
+    def _load_spool(self) -> list:
+        if not self.spool_file or not os.path.exists(self.spool_file):
+            return []
+        alerts = []
+        with open(self.spool_file, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    alert = json.loads(line)
+                except ValueError:
+                    continue
+                alerts.append((alert['title'], alert['desp']))
+        return alerts
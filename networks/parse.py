@@ -0,0 +1,54 @@
+import time
+from collections import namedtuple
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError: # optional, falls back to the standard library
+    import json
+    loads = json.loads
+
+# field order matches the holes/comments tables, rows go straight into executemany
+HoleRow = namedtuple('HoleRow', ['pid', 'text', 'type', 'time', 'reply', 'likenum', 'last_retrive'])
+CommentRow = namedtuple('CommentRow', ['cid', 'pid', 'text', 'name', 'time', 'comment_id', 'last_retrive'])
+
+_minute_prefix = {}
+
+def format_timestamps(timestamps) -> list:
+    # 'YYYY-mm-dd HH:MM:SS' in local time, the date part is formatted once per minute
+    # same output as str(datetime.fromtimestamp(ts)) for whole-second timestamps
+    out = []
+    for ts in timestamps:
+        ts = int(ts)
+        minute = ts - ts % 60
+        prefix = _minute_prefix.get(minute)
+        if prefix is None:
+            if len(_minute_prefix) > 100000:
+                _minute_prefix.clear()
+            prefix = _minute_prefix[minute] = time.strftime('%Y-%m-%d %H:%M:', time.localtime(minute))
+        out.append(f"{prefix}{ts % 60:02d}")
+    return out
+
+def now_str() -> str:
+    return time.strftime('%Y-%m-%d %H:%M:%S')
+
+def parse_holes(items, last_retrive=None) -> list:
+    # page items -> dicts with the fields HoleTracker.merge and hole_rows need
+    last_retrive = last_retrive or now_str()
+    times = format_timestamps(item['timestamp'] for item in items)
+    return [{'pid': item['pid'], 'text': str(item['text']), 'type': item.get('type'), 'timestamp': item['timestamp'],
+             'time': t, 'reply': int(item['reply']), 'likenum': int(item['likenum']), 'last_retrive': last_retrive,
+             'is_top': bool(item.get('is_top'))}
+            for item, t in zip(items, times)]
+
+def parse_comments(items, last_retrive=None) -> list:
+    last_retrive = last_retrive or now_str()
+    times = format_timestamps(item['timestamp'] for item in items)
+    # missing comment_id is stored as 'nan', like the pandas path always did
+    return [CommentRow(item['cid'], item['pid'], str(item['text']), item.get('name'), t,
+                       'nan' if item.get('comment_id') is None else str(item['comment_id']), last_retrive)
+            for item, t in zip(items, times)]
+
+def hole_rows(records) -> list:
+    return [HoleRow(r['pid'], r['text'], r['type'], r['time'], r['reply'], r['likenum'], r['last_retrive'])
+            for r in records]
@@ -0,0 +1,120 @@
+import heapq
+import time
+
+class PollScheduler(object):
+    # comment refreshes of tracked holes ordered by due time in a min-heap
+    # fast threads are re-polled quickly, quiet ones back off exponentially,
+    # {budget} is a token bucket of HTTP requests per minute: every request of the monitor is charged,
+    # page scans, extra comment pages and retries included, and refreshes wait while it is empty
+    def __init__(self, min_interval=20, max_interval=600, budget=60, max_idle=5, target_growth=5, like_weight=0.5):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.budget = budget
+        self.max_idle = max_idle
+        self.target_growth = target_growth # new replies we want to see per poll
+        self.like_weight = like_weight
+        self._heap = []
+        self._due = {} # pid -> due time, heap entries that disagree are stale
+        self.allowance = float(budget)
+        self.updated = time.time()
+
+    def __len__(self):
+        return len(self._due)
+
+    def __contains__(self, pid):
+        return pid in self._due
+
+    def schedule(self, pid, due):
+        self._due[pid] = due
+        heapq.heappush(self._heap, (due, pid))
+
+    def add(self, hole, now):
+        # new holes are polled at once
+        hole.interval = self.min_interval
+        hole.polled_at = now
+        hole.polled_like = hole.likenum
+        self.schedule(hole.pid, now)
+
+    def remove(self, pid):
+        self._due.pop(pid, None)
+
+    def state(self) -> dict:
+        return {'due': list(self._due.items()), 'allowance': self.allowance, 'updated': self.updated}
+
+    def restore(self, state):
+        for pid, due in state['due']:
+            self.schedule(pid, due)
+        self.allowance = min(self.budget, state['allowance'])
+        self.updated = state['updated']
+
+    def _clean(self):
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def next_due(self):
+        self._clean()
+        return self._heap[0][0] if self._heap else None
+
+    def _refill(self, now):
+        if self.budget > 0:
+            self.allowance = min(self.budget, self.allowance + max(0, now - self.updated) * self.budget / 60)
+        self.updated = max(self.updated, now)
+
+    def charge(self, requests, now):
+        # requests sent since the last charge, the allowance may go negative after an expensive cycle
+        self._refill(now)
+        if self.budget > 0:
+            self.allowance -= requests
+
+    def next_wake(self, now):
+        # when the next refresh can run: a hole is due and the budget holds a request, None without holes
+        due = self.next_due()
+        if due is None:
+            return None
+        if self.budget > 0:
+            self._refill(now)
+            if self.allowance < 1:
+                due = max(due, now + (1 - self.allowance) * 60 / self.budget)
+        return due
+
+    def pop_due(self, now) -> list:
+        # pids due for a refresh, earliest first, as many as the request budget allows
+        self._refill(now)
+        limit = max(0, int(self.allowance)) if self.budget > 0 else len(self._due)
+        due = []
+        while len(due) < limit:
+            self._clean()
+            if not self._heap or self._heap[0][0] > now:
+                break
+            _, pid = heapq.heappop(self._heap)
+            del self._due[pid]
+            due.append(pid)
+        return due
+
+    def polled(self, hole, new_comments, now) -> bool:
+        # reschedule after a refresh from the growth seen since the previous one
+        # returns True once the hole stayed quiet for max_idle polls in a row
+        elapsed = max(1.0, now - hole.polled_at)
+        growth = new_comments + max(0, hole.likenum - hole.polled_like) * self.like_weight
+        hole.polled_at = now
+        hole.polled_like = hole.likenum
+        if growth > 0:
+            hole.idle_iters = 0
+            hole.interval = min(self.max_interval, max(self.min_interval, self.target_growth * elapsed / growth))
+        else:
+            hole.idle_iters += 1
+            if hole.idle_iters >= self.max_idle:
+                return True
+            hole.interval = min(self.max_interval, hole.interval * 2)
+        self.schedule(hole.pid, now + hole.interval)
+        return False
+
+    def failed(self, hole, now) -> bool:
+        # a refresh that got no answer counts as a quiet poll: back off, True after max_idle in a row
+        # polled_at/polled_like are kept so the next successful refresh still sees the growth since the last one
+        hole.idle_iters += 1
+        if hole.idle_iters >= self.max_idle:
+            return True
+        hole.interval = min(self.max_interval, max(self.min_interval, hole.interval * 2))
+        self.schedule(hole.pid, now + hole.interval)
+        return False
@@ -0,0 +1,36 @@
+import os
+import time
+
+from .archive import data_dir, day_databases
+from .config import settings
+from .database import SQLDatabase
+
+def latest_database():
+    databases = day_databases(data_dir())
+    if not databases:
+        raise RuntimeError("data 文件夹中没有数据库")
+    return databases[-1]
+
+def search_treehole():
+    options = settings['Search']
+    key_words = options['key_words']
+    table_name = options['table']
+    start = options['start'] or None
+    end = options['end'] or None
+    limit = options['limit']
+    database_name = options['database'] or latest_database()
+    if database_name == 'archive': # every day merged by export mode
+        database_name = os.path.join(data_dir(), "archive.db")
+    if not os.path.exists(database_name):
+        print(f"数据库 {database_name} 不存在")
+        return []
+
+    db = SQLDatabase(database_name, remove_exisited=False)
+    begin = time.perf_counter()
+    rows = db.search(key_words, table_name, start, end, limit)
+    elapsed = (time.perf_counter() - begin) * 1000
+    for row in rows:
+        print("\t".join(str(x) for x in row))
+    print(f"{database_name}: {len(rows)} 条结果，用时 {elapsed:.1f} ms")
+    db.close()
+    return rows
@@ -0,0 +1,74 @@
+class HoleRecord(object):
+    __slots__ = ('pid', 'text', 'type', 'time', 'timestamp', 'reply', 'likenum', 'last_retrive',
+                 'idle_iters', 'interval', 'polled_at', 'polled_like')
+
+    def __init__(self, pid, text, type, time, timestamp, reply, likenum, last_retrive):
+        self.pid = pid
+        self.text = text
+        self.type = type
+        self.time = time
+        self.timestamp = timestamp
+        self.reply = reply
+        self.likenum = likenum
+        self.last_retrive = last_retrive
+        self.idle_iters = 0 # comment refreshes without growth
+        # polling state owned by PollScheduler
+        self.interval = 0
+        self.polled_at = 0
+        self.polled_like = likenum
+
+class HoleTracker(object):
+    # pid keyed store of monitored holes and their polling state
+    def __init__(self):
+        self.holes = {}
+
+    def __len__(self):
+        return len(self.holes)
+
+    def __contains__(self, pid):
+        return pid in self.holes
+
+    def __iter__(self):
+        return iter(list(self.holes.values()))
+
+    def get(self, pid):
+        return self.holes.get(pid)
+
+    def merge(self, records):
+        # records: iterable of dicts holding pid, timestamp and the holes table columns
+        # fresh values overwrite tracked ones, the polling state is kept
+        # returns the holes seen for the first time
+        added = []
+        for rec in records:
+            pid = int(rec['pid'])
+            hole = self.holes.get(pid)
+            if hole is None:
+                hole = HoleRecord(pid, str(rec['text']), rec['type'], str(rec['time']), int(rec['timestamp']),
+                                  int(rec['reply']), int(rec['likenum']), rec['last_retrive'])
+                self.holes[pid] = hole
+                added.append(hole)
+            else:
+                hole.text = str(rec['text'])
+                hole.reply = int(rec['reply'])
+                hole.likenum = int(rec['likenum'])
+                hole.last_retrive = rec['last_retrive']
+        return added
+
+    def state(self) -> list:
+        # every slot of every hole, polling state included, for the checkpoint file
+        return [[getattr(hole, s) for s in HoleRecord.__slots__] for hole in self.holes.values()]
+
+    def restore(self, state):
+        for values in state:
+            hole = HoleRecord.__new__(HoleRecord)
+            for s, v in zip(HoleRecord.__slots__, values):
+                setattr(hole, s, v)
+            self.holes[hole.pid] = hole
+
+    def remove(self, pid):
+        return self.holes.pop(pid, None)
+
+    def rows(self, holes=None) -> list:
+        # (pid, text, type, time, reply, likenum, last_retrive) tuples for SQLDatabase.upsert_holes
+        holes = self.holes.values() if holes is None else holes
+        return [(h.pid, h.text, h.type, h.time, h.reply, h.likenum, h.last_retrive) for h in holes]
@@ -1,19 +1,74 @@
 import os
 import random
 import re
+import heapq
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from collections import OrderedDict
 
-import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from .config import config
+from .config import settings
 from .const import TreeHoleURLs
+from .metrics import metrics
+from .parse import loads, parse_holes, parse_comments
+
+# a failed comments request with one of these messages means the hole is gone, everything else is retried
+DELETED_MESSAGES = ('删除', '不存在')
+
+class HoleDeleted(Exception):
+    pass
+
+class RateLimiter(object):
+    # token bucket shared by every worker thread of a client
+    def __init__(self, rate:float, burst:int=1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0: # unlimited
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
 
 class TreeHoleClient(object):
     def __init__(self):
+        defaults = settings['Defaults']
+        if defaults['base_url']:
+            TreeHoleURLs.set_base(defaults['base_url'])
+        self.workers = defaults['workers']
+        self.rate_limiter = RateLimiter(defaults['rate_limit'], defaults['rate_burst'])
+        self._executor = None
+        # HTTP requests sent, urllib3 retries included, the monitor charges them to its request budget
+        self.requests = 0
+        self._requests_lock = threading.Lock()
+        # highest cid already stored for each pid, only newer comments are fetched
+        # advanced by the owner of the database once the rows are committed
+        self.known_cids = {}
+        self.delta_page_size = 20
+        self.retry_backoff = defaults['retry_backoff']
         self._session = requests.Session()
+        # keep-alive pool sized for the workers, retry transient failures with backoff
+        retry = Retry(total=3, backoff_factor=1, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=frozenset(['GET']), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=max(10, self.workers), max_retries=retry)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
         self._headers = {}
         self._headers['User-Agent'] = random.choice([
         'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_5) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/13.1.1 Safari/605.1.15',
@@ -26,8 +81,8 @@ class TreeHoleClient(object):
 
         # read from config file
         self.user_inf = {
-            'password' : config['User']['password'],
-            'uid' : config['User']['uid']
+            'password' : settings['User']['password'],
+            'uid' : settings['User']['uid']
         }
     
     def login(self):
@@ -42,10 +97,7 @@ class TreeHoleClient(object):
         match = re.search(r"(?P<xsrf>XSRF-TOKEN=.*?);.*?(?P<_session>_session=.*?);.*", xsrf_resp.headers['Set-Cookie'])
         self._xsrf_token = match.group('xsrf')
         self._session_token = match.group('_session')
-        
-        self._headers['Cookie'] = f"pku_token={self._pku_token}; {self._xsrf_token}; {self._session_token}"
-        self._headers['Authorization'] =f"Bearer {self._pku_token}"
-        self._headers['Referer'] = TreeHoleURLs.Verification
+        self._set_auth_headers()
         
         # accepting the verifying code
         verify_resp = self._session.post(TreeHoleURLs.Query_msg, headers=self._headers)
@@ -72,15 +124,52 @@ class TreeHoleClient(object):
             else:
                 print("验证码错误！尝试重新输入")
 
-    def get_tree_hole_data(self, page):
+    def _set_auth_headers(self):
+        self._headers['Cookie'] = f"pku_token={self._pku_token}; {self._xsrf_token}; {self._session_token}"
+        self._headers['Authorization'] =f"Bearer {self._pku_token}"
+        self._headers['Referer'] = TreeHoleURLs.Verification
+
+    def session_state(self) -> dict:
+        # tokens of a finished login, saved so a restart can skip the SMS code
+        if getattr(self, '_pku_token', None) is None:
+            return {}
+        return {'pku_token': self._pku_token, 'xsrf_token': self._xsrf_token, 'session_token': self._session_token,
+                'user_agent': self._headers['User-Agent'], 'cookies': self._session.cookies.get_dict()}
+
+    def restore_session(self, state:dict) -> bool:
+        # reuse the tokens of an earlier run for as long as the server accepts them
+        if not state.get('pku_token'):
+            return False
+        self._pku_token = state['pku_token']
+        self._xsrf_token = state['xsrf_token']
+        self._session_token = state['session_token']
+        self._headers['User-Agent'] = state['user_agent']
+        self._session.cookies.update(state.get('cookies', {}))
+        self._set_auth_headers()
+        try:
+            resp = self._get('pku_hole', TreeHoleURLs.Api_content, {'page': 1, 'limit': 1})
+            if resp.status_code == 200 and loads(resp.content).get('success'):
+                return True
+        except (requests.RequestException, ValueError):
+            pass
+        print("保存的登录状态已失效，重新登录")
+        self._pku_token = None
+        self._session.cookies.clear()
+        for key in ('Cookie', 'Authorization', 'Referer'):
+            self._headers.pop(key, None)
+        return False
+
+    def get_tree_hole_records(self, page):
         for attempt in range(4):  # 尝试最多4次
             get_dat = {
                 'page': page,
                 'limit': 25
             }
-            resp_content = self._session.get(TreeHoleURLs.Api_content, params=get_dat, headers=self._headers)
-            if resp_content.status_code != 200 or resp_content.json().get('success') == False:
+            resp_content = self._get('pku_hole', TreeHoleURLs.Api_content, get_dat)
+            payload = loads(resp_content.content) if resp_content.status_code == 200 else None
+            if payload is None or payload.get('success') == False:
                 if attempt < 3:  # 如果不是最后一次尝试，则休息
+                    metrics.inc('http_retries_total', endpoint='pku_hole')
                     print(f"Attempt {attempt + 1}: Response is empty or unsuccessful, retrying in 30 seconds...")
                     time.sleep(30*attempt)
                     continue
@@ -90,34 +179,91 @@ class TreeHoleClient(object):
                         print(f"请求失败，状态码：{resp_content.status_code}")
                         print(f"错误信息：{resp_content.text}")
                     else:
-                        print(f"请求失败，错误信息：{resp_content.json().get('message')}")
+                        print(f"请求失败，错误信息：{payload.get('message')}")
                     print(f"{str(datetime.now()).split('.')[0]}")
                     print("Failed to retrieve data after 4 attempts.")
                     raise RuntimeError("Failed to retrieve data.")
             # 如果成功获取到数据，处理数据
-            page_df = pd.json_normalize(resp_content.json()['data']['data'])
-            page_df = page_df.set_index('pid')
-            page_df['last_retrive'] = str(datetime.now()).split('.')[0]
-            page_df.loc[:, 'text'] = page_df.text.astype(str)
-            page_df['time'] = page_df.timestamp.apply(datetime.fromtimestamp).astype(str)
-            return page_df
+            with metrics.timer('stage_seconds', stage='parse_page'):
+                return parse_holes(payload['data']['data'])
         # 如果循环结束还没有成功获取数据，则抛出异常
         raise RuntimeError("Failed to retrieve data after 4 attempts.")
 
-    def get_comments_data(self, pid:str, reply_num:int):
-        get_dat = {
-            'limit': str(max(10, reply_num))
-        }
-        time.sleep(0.5)
-        resp_content = self._session.get(TreeHoleURLs.Api_comments+"/"+str(pid), params=get_dat, headers=self._headers)
-        comments_df = pd.json_normalize(resp_content.json()['data']['data'])
-        comments_df = comments_df.set_index('cid')
-        comments_df['last_retrive'] = str(datetime.now()).split('.')[0]
-        # covert Nonetype to string
-        comments_df.text = comments_df.text.astype(str)
-        comments_df.comment_id = comments_df.comment_id.astype(str)
-        comments_df['time'] = comments_df.timestamp.apply(datetime.fromtimestamp).astype(str)
-        return comments_df
+    def _get(self, endpoint, url, params):
+        self.rate_limiter.acquire()
+        with metrics.timer('http_request_seconds', endpoint=endpoint):
+            resp = self._session.get(url, params=params, headers=self._headers)
+        metrics.inc('http_responses_total', endpoint=endpoint, status=f"{resp.status_code // 100}xx")
+        retries = getattr(resp.raw, 'retries', None) # retried by urllib3 before we got resp
+        retried = len(retries.history) if retries is not None else 0
+        if retried:
+            metrics.inc('http_retries_total', retried, endpoint=endpoint)
+        with self._requests_lock:
+            self.requests += 1 + retried
+        return resp
+
+    def _request_comments(self, pid, params):
+        # throttled and failed requests are retried after retry_backoff, 2*retry_backoff, ... seconds,
+        # HoleDeleted only when the server says the hole was deleted
+        for attempt in range(4):
+            resp_content = self._get('pku_comment_v3', TreeHoleURLs.Api_comments+"/"+str(pid), params)
+            payload = loads(resp_content.content) if resp_content.status_code == 200 else None
+            if payload is not None and payload.get('success') and 'data' in payload:
+                return payload['data']
+            message = str(payload.get('message', '')) if payload is not None else resp_content.text[:200]
+            if payload is not None and any(mark in message for mark in DELETED_MESSAGES):
+                raise HoleDeleted(message)
+            if attempt < 3:
+                metrics.inc('http_retries_total', endpoint='pku_comment_v3')
+                time.sleep(self.retry_backoff * 2**attempt)
+        raise RuntimeError(f"Failed to retrieve comments of {pid}: {resp_content.status_code} {message}")
+
+    def get_comments_records(self, pid:str, reply_num:int):
+        known_cid = self.known_cids.get(pid)
+        if known_cid is None:
+            # first visit, take the whole thread in one request
+            comments = self._request_comments(pid, {'limit': str(max(10, reply_num))})['data']
+        else:
+            # newest first, stop paging once we reach stored comments
+            comments = []
+            page = 1
+            while True:
+                data = self._request_comments(pid, {'page': page, 'limit': self.delta_page_size, 'sort': 'desc'})
+                new_comments = [c for c in data['data'] if c['cid'] > known_cid]
+                comments.extend(new_comments)
+                if len(new_comments) < len(data['data']) or len(data['data']) < self.delta_page_size \
+                        or page >= int(data.get('last_page', page)):
+                    break
+                page += 1
+        with metrics.timer('stage_seconds', stage='parse_comments'):
+            return parse_comments(comments)
+
+    def _comments_result(self, pid, reply_num):
+        try:
+            return pid, self.get_comments_records(pid, reply_num), None
+        except Exception as e:
+            return pid, None, e
+
+    def submit_comments(self, pid, reply_num):
+        # future of (pid, comment rows, error), the caller keeps working while the thread is fetched
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=max(1, self.workers), thread_name_prefix='comments')
+        return self._executor.submit(self._comments_result, pid, reply_num)
+
+    def get_comments_batch(self, holes):
+        # holes: iterable of (pid, reply_num)
+        # yields (pid, comment rows, error) in completion order, error is None on success
+        holes = list(holes)
+        if self.workers <= 1:
+            for pid, reply_num in holes:
+                yield self._comments_result(pid, reply_num)
+            return
+        for future in as_completed([self.submit_comments(pid, reply_num) for pid, reply_num in holes]):
+            yield future.result()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
    
 def print_time(func):
     def inner(*args, **kwargs):
@@ -128,21 +274,80 @@ def print_time(func):
     return inner
 
 class HotHoles:
-    def __init__(self):
-        # 初始化一个空的OrderedDict，用来存储pid和hotness
-        # 使用lambda x:x[1]来根据hotness排序
-        self.holes = OrderedDict()
-
-    def add_hole(self, pid, hotness):
-        # 如果新hole的hotness大于当前最小的hotness，则加入字典
-        if len(self.holes) < 5 or hotness > list(self.holes.items())[-1][1]:
-            self.holes[pid] = hotness
-            # 确保字典按hotness排序
-            self.holes = OrderedDict(sorted(self.holes.items(), key=lambda x: x[1], reverse=True))
-            # 如果字典长度超过5，移除热度最低的hole
-            if len(self.holes) > 5:
-                self.holes.popitem(last=True)
-
-    def get_holes(self):
-        # 返回当前的holes
-        return self.holes
\ No newline at end of file
+    def __init__(self, top_k:int=5, window:int=24*60*60):
+        # 滑动窗口内所有帖子的热度 pid -> (hotness, timestamp)
+        self.top_k = top_k
+        self.window = window
+        self.scores = {}
+        # 前top_k名的最小堆，堆中条目与self._top不一致即为过期条目
+        self._top = {}
+        self._heap = []
+        # (timestamp, pid) 最小堆，用于按发帖时间淘汰
+        self._expiry = []
+        self._dirty = False
+
+    def add_hole(self, pid, hotness, timestamp=None):
+        if self.top_k <= 0: # show_hot_num = 0, nothing to rank
+            return
+        now = time.time()
+        timestamp = now if timestamp is None else timestamp
+        if timestamp < now - self.window:
+            return
+        old = self.scores.get(pid)
+        if old is not None and old[0] == hotness:
+            return
+        self.scores[pid] = (hotness, timestamp)
+        if old is None:
+            heapq.heappush(self._expiry, (timestamp, pid))
+        if pid in self._top:
+            if hotness < self._top[pid]:
+                # a top hole cooled down, someone outside may overtake it
+                self._dirty = True
+            else:
+                self._top[pid] = hotness
+                heapq.heappush(self._heap, (hotness, pid))
+        elif not self._dirty:
+            self._clean_heap()
+            if len(self._top) < self.top_k:
+                self._push_top(pid, hotness)
+            elif hotness > self._heap[0][0]:
+                _, min_pid = heapq.heappop(self._heap)
+                del self._top[min_pid]
+                self._push_top(pid, hotness)
+
+    def state(self) -> list:
+        return [[pid, hotness, timestamp] for pid, (hotness, timestamp) in self.scores.items()]
+
+    def restore(self, state):
+        for pid, hotness, timestamp in state:
+            self.add_hole(pid, hotness, timestamp)
+
+    def _push_top(self, pid, hotness):
+        self._top[pid] = hotness
+        heapq.heappush(self._heap, (hotness, pid))
+
+    def _clean_heap(self):
+        while self._heap and self._top.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def expire(self, now=None):
+        cutoff = (time.time() if now is None else now) - self.window
+        while self._expiry and self._expiry[0][0] < cutoff:
+            _, pid = heapq.heappop(self._expiry)
+            del self.scores[pid]
+            if self._top.pop(pid, None) is not None:
+                self._dirty = True
+
+    def _rebuild(self):
+        top = heapq.nlargest(self.top_k, self.scores.items(), key=lambda x: x[1][0])
+        self._top = {pid: score[0] for pid, score in top}
+        self._heap = [(hotness, pid) for pid, hotness in self._top.items()]
+        heapq.heapify(self._heap)
+        self._dirty = False
+
+    def get_holes(self, now=None):
+        # 返回当前窗口内热度最高的holes，按热度降序
+        self.expire(now)
+        if self._dirty:
+            self._rebuild()
+        return OrderedDict(sorted(self._top.items(), key=lambda x: x[1], reverse=True))
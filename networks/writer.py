@@ -0,0 +1,163 @@
+import queue
+import sqlite3
+import threading
+import time
+import traceback
+
+from .database import HOLES_UPSERT, COMMENTS_INSERT, HISTORY_INSERT, index_pending
+from .metrics import metrics
+
+_STOP = 'stop'
+_FLUSH = 'flush'
+
+class DBWriter(object):
+    # write-behind persistence: the crawl loop enqueues rows and one thread commits them in batches
+    # on_commit(holes, comments) is called from the writer thread after each successful commit
+    # a batch that fails is kept and retried {retries} times with backoff, if it still fails the error
+    # is raised in the crawl loop by the next write or flush, the rows stay queued for close()
+    # any other exception (a row sqlite cannot bind, on_commit) stops the thread, writes and flushes then raise
+    def __init__(self, db, max_queue=1000, batch_rows=1000, flush_interval=1.0, on_commit=None, retries=5):
+        self.db = db
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self.on_commit = on_commit
+        self.retries = retries
+        self.error = None
+        self.closed = False
+        self.queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._thread.start()
+
+    def upsert_holes(self, rows):
+        self._put('holes', list(rows))
+
+    def insert_comments(self, rows):
+        self._put('comments', list(rows))
+
+    def insert_history(self, rows):
+        self._put('history', list(rows))
+
+    def _check(self):
+        if self.error is not None:
+            raise RuntimeError(f"写入数据库失败：{self.error}")
+        if not self.closed and not self._thread.is_alive():
+            raise RuntimeError("写入线程已退出")
+
+    def _enqueue(self, item) -> bool:
+        # False once the thread is gone, nobody would take the item
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except queue.Full:
+            # backpressure, block the crawl loop until the writer catches up
+            metrics.inc('db_queue_full_total')
+        while self._thread.is_alive():
+            try:
+                self.queue.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _put(self, kind, rows):
+        self._check()
+        if not rows:
+            return
+        if not self._enqueue((kind, rows)):
+            self._check()
+        metrics.set('db_queue_size', self.queue.qsize())
+
+    def flush(self):
+        # block until everything queued so far is committed, needed before reading back from the DB
+        if self.closed:
+            return
+        self._check()
+        done = threading.Event()
+        if self._enqueue((_FLUSH, done)):
+            while not done.wait(1) and self._thread.is_alive():
+                pass
+        self._check()
+
+    def close(self):
+        self.closed = True
+        if self._enqueue((_STOP, None)):
+            self._thread.join()
+
+    def _commit(self, conn, holes, comments, history) -> bool:
+        # one transaction, rolled back and retried as a whole
+        for attempt in range(self.retries + 1):
+            try:
+                with metrics.timer('db_write_seconds', table='batch'), conn:
+                    conn.executemany(HOLES_UPSERT, holes)
+                    conn.executemany(COMMENTS_INSERT, comments)
+                    if self.db.fts:
+                        index_pending(conn, 'holes', 'pid')
+                        index_pending(conn, 'comments', 'cid')
+                    if history:
+                        conn.executemany(HISTORY_INSERT, history)
+            except sqlite3.Error as e:
+                metrics.inc('db_write_errors_total')
+                print(f"写入数据库失败({e})，第{attempt + 1}次")
+                if attempt == self.retries:
+                    traceback.print_exc()
+                    self.error = e
+                    return False
+                time.sleep(min(30, 2**attempt))
+                continue
+            metrics.inc('db_rows_total', len(holes), table='holes')
+            metrics.inc('db_rows_total', len(comments), table='comments')
+            metrics.inc('db_rows_total', len(history), table='hole_history')
+            self.error = None
+            if self.on_commit is not None:
+                self.on_commit(holes, comments)
+            return True
+
+    def _run(self):
+        # own connection, WAL lets the crawl loop read while we write
+        # day mode worker processes share the database, wait for each other's commits
+        conn = sqlite3.connect(self.db.database_name, timeout=60)
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._loop(conn)
+        except Exception as e:
+            self.error = e
+            traceback.print_exc()
+            print(f"写入线程异常退出({e!r})，未提交的数据已丢弃")
+        finally:
+            conn.close()
+
+    def _loop(self, conn):
+        holes = {} # pid -> row, the latest row of a hole wins
+        comments = []
+        history = []
+        pending = 0
+        first = None
+        while True:
+            timeout = None if first is None else max(0, first + self.flush_interval - time.monotonic())
+            try:
+                kind, payload = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                kind, payload = None, None
+            if kind == 'holes':
+                holes.update((row[0], row) for row in payload)
+                pending += len(payload)
+            elif kind == 'comments':
+                comments.extend(payload)
+                pending += len(payload)
+            elif kind == 'history':
+                history.extend(payload)
+                pending += len(payload)
+            if pending and first is None:
+                first = time.monotonic()
+            if pending and (kind in (_FLUSH, _STOP) or pending >= self.batch_rows
+                            or time.monotonic() - first >= self.flush_interval):
+                if self._commit(conn, list(holes.values()), comments, history):
+                    holes, comments, history, pending, first = {}, [], [], 0, None
+                else: # keep the rows, the next batch retries them
+                    first = time.monotonic()
+            if kind == _FLUSH:
+                payload.set()
+            elif kind == _STOP:
+                if pending:
+                    print(f"{pending} 行数据未能写入数据库")
+                return